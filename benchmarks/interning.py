@@ -0,0 +1,51 @@
+# interning.py
+# measures the memory held by records decoded over several separate calls (like !compare fetching each user's times)
+# run from the repo root: python benchmarks/interning.py [calls] [rows per call]
+import asyncio
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from modules.strafes import StrafesClient
+
+MAP_COUNT = 300
+USER_COUNT = 50
+
+def fake_records(call, count):
+    for i in range(count):
+        n = call * count + i
+        yield {
+            "id": n,
+            "time": 30000 + n * 7,
+            "user": {"id": n % USER_COUNT, "username": f"user{n % USER_COUNT}"},
+            "map": {"id": (n * 13) % MAP_COUNT, "display_name": f"map {(n * 13) % MAP_COUNT}", "game_id": 1},
+            "date": f"2023-{1 + n % 12:02}-{1 + n % 28:02}T{n % 24:02}:{n % 60:02}:{(n * 7) % 60:02}Z",
+            "style_id": 1,
+            "mode_id": 0,
+            "game_id": 1,
+            "has_bot": False
+        }
+
+async def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    data = [list(fake_records(call, count)) for call in range(calls)]
+    strafes = StrafesClient("", "", cache_path=None, catalog_path=None)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    records = [strafes.records_from_dicts(page) for page in data]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    flat = [record for page in records for record in page]
+    print(f"records:        {len(flat)} ({calls} calls of {count})")
+    print(f"memory:         {(after - before) / 1024:.1f} KiB ({(after - before) / len(flat):.1f} bytes per record)")
+    print(f"map objects:    {len({id(record.map) for record in flat})}")
+    print(f"user objects:   {len({id(record.user) for record in flat})}")
+    await strafes.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
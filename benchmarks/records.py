@@ -0,0 +1,88 @@
+# records.py
+# measures the memory and time it takes to build records with Record.from_dict (which records_from_dicts uses
+# for every time, without the user/map interning) and compares sorting/filtering a list of records
+# (how !times used to do it) with a RecordBatch
+# run from the repo root: python benchmarks/records.py [count]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from modules.record_batch import RecordBatch
+from modules.strafes_base import Game, Map, Record, Style, User
+
+def fake_records(count):
+    for i in range(count):
+        yield {
+            "id": i,
+            "time": 30000 + i * 7,
+            "user_id": i % 50,
+            "map_id": i % 2000,
+            "map": {"id": i % 2000, "display_name": f"map {i % 2000}", "game_id": 1 + i % 2},
+            "date": f"2023-{1 + i % 12:02}-{1 + i % 28:02}T{i % 24:02}:{i % 60:02}:{(i * 7) % 60:02}Z",
+            "style_id": 1 + i % 7,
+            "mode_id": 0,
+            "game_id": 1 + i % 2,
+            "has_bot": i % 3 == 0
+        }
+
+# best of repeat runs, in ms
+def best_time(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    data = list(fake_records(count))
+    users = {i: User(i, f"user{i}") for i in range(50)}
+    maps = {i: Map(i, f"map {i}", "creator", Game.BHOP, None, 0, None) for i in range(2000)}
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    records = [Record.from_dict(d, users[d["user_id"]], maps[d["map_id"]]) for d in data]
+    build = time.perf_counter() - start
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for record in records:
+        str(record.time)
+        str(record.date)
+    format_time = time.perf_counter() - start
+
+    print(f"records:            {count}")
+    print(f"memory:             {(after - before) / 1024:.1f} KiB ({(after - before) / count:.1f} bytes per record)")
+    print(f"peak memory:        {(peak - before) / 1024:.1f} KiB")
+    print(f"build:              {build * 1000:.1f} ms")
+    print(f"format time + date: {format_time * 1000:.1f} ms")
+
+    # the same times as one user's RecordBatch, sorted and filtered the way !times does
+    # the list cases are what !times did before RecordBatch, the sorts take the first page of 25 like !times
+    batch = RecordBatch.from_dicts(data, users[0])
+    cases = [
+        ("sort by time",
+            lambda: sorted(records, key=lambda i : (i.time.millis, i.date.timestamp * -1))[:25],
+            lambda: batch.sort("time")[:25].materialize(maps)),
+        ("sort by name",
+            lambda: sorted(records, key=lambda i : (i.map.displayname, i.date.timestamp * -1))[:25],
+            lambda: batch.sort("name")[:25].materialize(maps)),
+        ("filter by style",
+            lambda: [record for record in records if record.style == Style.AUTOHOP],
+            lambda: batch.filter(style=Style.AUTOHOP))
+    ]
+    print()
+    print(f"{'':20}{'list':>10}{'batch':>10}")
+    for name, with_list, with_batch in cases:
+        print(f"{name + ':':20}{best_time(with_list):>7.2f} ms{best_time(with_batch):>7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,15 @@ from discord.ext.commands.errors import CheckFailure
 import json
 import traceback
 import sys
+from typing import Any, Dict, Optional
 
 from modules import utils
 from modules.strafes import APIError
 
 class StrafesBot(commands.Bot):
 
-    def __init__(self, strafes_key : str, verify_key : str, bhop_auto_globals : int, bhop_styles_globals : int, surf_auto_globals : int, surf_styles_globals : int, globals : int, **kwargs):
+    def __init__(self, strafes_key : str, verify_key : str, bhop_auto_globals : int, bhop_styles_globals : int, surf_auto_globals : int, surf_styles_globals : int, globals : int, 
+            http_pool : Optional[Dict[str, Any]] = None, **kwargs):
         super().__init__(**kwargs)
         self.strafes_key = strafes_key
         self.verify_key = verify_key
@@ -22,6 +24,7 @@ class StrafesBot(commands.Bot):
         self.surf_auto_globals = surf_auto_globals
         self.surf_styles_globals = surf_styles_globals
         self.globals = globals
+        self.http_pool = http_pool if http_pool is not None else {}
 
     async def on_ready(self):
         print(f"{self.user} has connected to Discord!")
@@ -99,10 +102,11 @@ async def main():
     SURF_AUTO_GLOBALS = config["SURF_AUTO_GLOBALS"]
     SURF_STYLES_GLOBALS = config["SURF_STYLES_GLOBALS"]
     GLOBALS = config["GLOBALS"]
+    HTTP_POOL = config.get("HTTP_POOL", {})
 
     intents = discord.Intents.default()
     intents.message_content = True
-    bot = StrafesBot(STRAFES, VERIFY, BHOP_AUTO_GLOBALS, BHOP_STYLES_GLOBALS, SURF_AUTO_GLOBALS, SURF_STYLES_GLOBALS, GLOBALS, command_prefix=COMMAND, intents=intents, max_ratelimit_timeout=30.0)
+    bot = StrafesBot(STRAFES, VERIFY, BHOP_AUTO_GLOBALS, BHOP_STYLES_GLOBALS, SURF_AUTO_GLOBALS, SURF_STYLES_GLOBALS, GLOBALS, HTTP_POOL, command_prefix=COMMAND, intents=intents, max_ratelimit_timeout=30.0)
 
     #shamelessly adapted from here
     #https://stackoverflow.com/questions/40667445/how-would-i-make-a-reload-command-in-python-for-a-discord-bot
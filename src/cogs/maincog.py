@@ -1,20 +1,20 @@
 # maincog.py
 import asyncio
-import colorsys
 import discord
 from discord.ext.commands.context import Context
 from discord.ext import commands, tasks
 from io import BytesIO, StringIO
-import numpy
-from PIL import Image
 import time
 import traceback
-from typing import Callable, Coroutine, Dict, List, Tuple, Union
+from typing import Callable, Coroutine, Dict, List, Union
 
 from bot import StrafesBot
 from modules.strafes_base import *
 from modules.strafes import APIError, StrafesClient, ErrorCode
-from modules import utils
+from modules.http import PoolConfig, Priority
+from modules.compare import MAX_COMPARE_USERS, compare_times
+from modules.record_batch import RecordBatch
+from modules import compositing, utils
 from modules.utils import Incrementer, StringBuilder
 from modules.arguments import ArgumentValidator
 
@@ -142,27 +142,30 @@ class MainCog(commands.Cog):
         self.bot = bot
         self.bot.remove_command("help")
         self.strafes : StrafesClient = None
-        self.maps_started = False
         self.globals_started = False
         self.lock = asyncio.Lock()
         self.active_commands : Dict[int, UserActiveCommandManager] = {}
 
     async def cog_load(self):
         print("Loading maincog")
-        self.strafes = StrafesClient(self.bot.strafes_key, self.bot.verify_key)
+        self.strafes = StrafesClient(self.bot.strafes_key, self.bot.verify_key, pool_config=PoolConfig.from_dict(self.bot.http_pool))
         print("Loading maps")
         start = time.monotonic()
-        #await self.strafes.load_maps()
+        loaded = await self.strafes.load_saved_maps()
         end = time.monotonic()
-        print(f"Done loading maps ({end-start:.3f}s)")
-        #self.update_maps.start()
+        if loaded:
+            print(f"Done loading saved maps ({end-start:.3f}s)")
+        else:
+            print("No saved maps, loading in the background")
+        # also checks the saved maps for anything new
+        self.update_maps.start()
         self.global_announcements.start()
         print("Maincog loaded")
     
     async def cog_unload(self):
         print("Unloading maincog")
         self.global_announcements.cancel()
-        #self.update_maps.cancel()
+        self.update_maps.cancel()
         await self.strafes.close()
 
     async def task_wrapper(self, task : Coroutine[Any, Any, None], task_name : str):
@@ -181,10 +184,7 @@ class MainCog(commands.Cog):
                 pass
 
     async def update_maps_task(self):
-        if not self.maps_started:
-            self.maps_started = True
-        else:
-            await self.strafes.load_maps()
+        await self.strafes.refresh_maps(priority=Priority.BACKGROUND)
 
     @tasks.loop(minutes=60)
     async def update_maps(self):
@@ -209,11 +209,11 @@ class MainCog(commands.Cog):
     async def globals_task(self):
         # when the bot first runs, overwrite globals then stop
         if not self.globals_started:
-            await self.strafes.write_wrs()
+            await self.strafes.write_wrs(priority=Priority.BACKGROUND)
             self.globals_started = True
             return
         start = time.time()
-        records = await self.strafes.get_new_wrs()
+        records = await self.strafes.get_new_wrs(priority=Priority.BACKGROUND)
         if len(records) > 0:
             end = time.time()
             print(f"get new wrs: {end-start}s")
@@ -652,8 +652,8 @@ class MainCog(commands.Cog):
                 page = arguments.page.value
 
             if sort and sort != "date":
-                record_list, _ = await self.strafes.get_user_times(user, game, style, -1)
-                page_count = ((len(record_list) - 1) // 25) + 1
+                batch = await self.strafes.get_user_time_batch(user, game, style)
+                page_count = ((len(batch) - 1) // 25) + 1
             else:
                 record_list, page_count = await self.strafes.get_user_times(user, game, style, page)
             if page_count == 0:
@@ -666,13 +666,11 @@ class MainCog(commands.Cog):
             if page > page_count:
                 page = page_count
             if sort and sort != "date":
-                if sort == "time":
-                    record_list.sort(key=lambda i : (i.time.millis, i.date.timestamp * -1))
-                elif sort == "name":
-                    record_list.sort(key=lambda i : (i.map.displayname, i.date.timestamp * -1))
+                batch = batch.sort(sort)
                 if page != -1:
                     end = page * 25
-                    record_list = record_list[end-25:end]
+                    batch = batch[end-25:end]
+                record_list = batch.materialize()
             else:
                 sort = "date"
             cols = [MessageCol.MAP_NAME, MessageCol.TIME, MessageCol.DATE]
@@ -731,8 +729,8 @@ class MainCog(commands.Cog):
                 if not valid:
                     await ctx.send(utils.fmt_md_code(err))
                     return
-                if len(users) > 7:
-                    await ctx.send(utils.fmt_md_code("You can only compare up to 8 users at a time."))
+                if len(users) >= MAX_COMPARE_USERS:
+                    await ctx.send(utils.fmt_md_code(f"You can only compare up to {MAX_COMPARE_USERS} users at a time."))
                     return
                 else:
                     users.append(arguments.user.value)
@@ -763,41 +761,19 @@ class MainCog(commands.Cog):
                     comparables_list.append(comparable)
             
             tasks = []
-            for c in comparables:
-                tasks.append(self.strafes.get_user_times(c.user, game, c.style, -1))
-            times : List[Tuple[List[Record], int]] = await asyncio.gather(*tasks)
-
-            wins : List[List[Record]] = [[] for _ in users]
-            ties : List[Record] = []
-            not_shared : List[List[Record]] = [[] for _ in users]
-            combined : Dict[Map, List[Record]] = {}
-            for records, _ in times:
-                for record in records:
-                    if record.map in combined:
-                        combined[record.map].append(record)
-                    else:
-                        combined[record.map] = [record]
-            for records in combined.values():
-                if len(records) == 1:
-                    not_shared[self.record_to_idx(records[0], comparables)].append(records[0])
-                else:
-                    best = None
-                    tie = False
-                    for record in records:
-                        if best is None:
-                            best = record
-                        elif record.time.millis < best.time.millis:
-                            tie = False
-                            record.previous_record = best
-                            best = record
-                        elif record.time.millis == best.time.millis:
-                            tie = True
-                        elif best.previous_record is None or best.previous_record.time.millis > record.time.millis:
-                            best.previous_record = record
-                    if tie:
-                        ties.append(best)
-                    else:
-                        wins[self.record_to_idx(best, comparables)].append(best)
+            for c in comparables_list:
+                tasks.append(self.strafes.get_user_time_batch(c.user, game, c.style))
+            batches : List[RecordBatch] = await asyncio.gather(*tasks)
+            result = compare_times([batch.data["map"] for batch in batches], [batch.data["time"] for batch in batches])
+
+            wins : List[List[Record]] = []
+            for i, batch in enumerate(batches):
+                ls = batch[result.wins[i]].materialize()
+                for record, runner_up_user, runner_up_row in zip(ls, result.runner_up_user[i].tolist(), result.runner_up_row[i].tolist()):
+                    record.previous_record = batches[runner_up_user][runner_up_row:runner_up_row+1].materialize()[0]
+                wins.append(ls)
+            ties : List[Record] = [batches[user][row:row+1].materialize()[0] for user, row in zip(result.tie_user.tolist(), result.tie_row.tolist())]
+            not_shared : List[List[Record]] = [batch[result.exclusive[i]].materialize() for i, batch in enumerate(batches)]
             for ls in wins:
                 ls.sort(key=lambda i : i.map.displayname)
             ties.sort(key=lambda i : i.map.displayname)
@@ -811,41 +787,16 @@ class MainCog(commands.Cog):
             embed = discord.Embed(title=title, color=0x00ff7f)
             file = None
 
-            if len(users) == 2:
-                tasks = [self.safe_get_user_headshot_url(users[0].id), self.safe_get_user_headshot_url(users[1].id)]
-                urls = await asyncio.gather(*tasks)
-                url1 = urls[0]
-                url2 = urls[1]
-                file = None
-                if url1 is not None and url2 is not None:
-                    try:
-                        tasks = [self.strafes.get_bytes(url1), self.strafes.get_bytes(url2)]
-                        images = await asyncio.gather(*tasks)
-                        img1 = Image.open(BytesIO(images[0]))
-                        img2 = Image.open(BytesIO(images[1]))
-                        pixels1 = numpy.asarray(img1)
-                        pixels2 = numpy.asarray(img2)
-                        # Create a new image by drawing a diagonal line between the two images and combining them
-                        new_pixels = [list(range(180)) for _ in range(180)]
-                        for i in range(180):
-                            for j in range(180):
-                                val = i + j
-                                if val < 177:
-                                    new_pixels[i][j] = pixels1[i][j]
-                                elif val > 183:
-                                    new_pixels[i][j] = pixels2[i][j]
-                                else:
-                                    r, g, b = colorsys.hsv_to_rgb(i / 180, 1, 1)
-                                    new_pixels[i][j] = numpy.asarray([r * 255, g * 255, b * 255, 255], dtype=numpy.uint8)
-                        new_image = Image.fromarray(numpy.array(new_pixels))
-                        # https://stackoverflow.com/questions/63209888/send-pillow-image-on-discord-without-saving-the-image
-                        with BytesIO() as image_binary:
-                            new_image.save(image_binary, "PNG")
-                            image_binary.seek(0)
-                            file = discord.File(fp=image_binary, filename="thumb.png")
-                            embed.set_thumbnail(url="attachment://thumb.png")
-                    except:
-                        pass
+            # thumbnail of every user's avatar split diagonally
+            urls = await asyncio.gather(*[self.safe_get_user_headshot_url(user.id) for user in users])
+            if all(url is not None for url in urls):
+                try:
+                    images = await asyncio.gather(*[self.strafes.get_bytes(url) for url in urls])
+                    png = await asyncio.to_thread(compositing.composite_png, images)
+                    file = discord.File(fp=BytesIO(png), filename="thumb.png")
+                    embed.set_thumbnail(url="attachment://thumb.png")
+                except:
+                    pass
 
             msg = []
             if len(styles) == 1:
@@ -903,9 +854,6 @@ class MainCog(commands.Cog):
         diff = (record.previous_record.time.millis - record.time.millis) / 1000.0
         return f"{record.previous_record.user.username} (+{diff:.3f}s)"
 
-    def record_to_idx(self, record : Record, comparables) -> int:
-        return comparables[ComparableUserStyle(record.user, record.style)]
-
     @commands.command(name="mapstatus")
     async def map_status(self, ctx:Context, *args : str):
         arguments = ArgumentValidator(self.bot, self.strafes)
@@ -924,13 +872,12 @@ class MainCog(commands.Cog):
         return
 
         async with ctx.typing():
-            records, _ = await self.strafes.get_user_times(user, game, style, -1)
-            completed_maps = set(i.map for i in records)
+            completed_maps = set((await self.strafes.get_user_time_batch(user, game, style)).map_ids().tolist())
             incompleted_maps = []
             map_count = await self.strafes.get_map_count(game)
             maps = await self.strafes.get_all_maps()
             for map in maps:
-                if map.game == game and map not in completed_maps:
+                if map.game == game and map.id not in completed_maps:
                     # TODO: binary search insert
                     incompleted_maps.append(map)
             incompleted_maps.sort(key=lambda i: i.displayname)
@@ -963,7 +910,6 @@ class MainCog(commands.Cog):
         if not the_maps:
             await ctx.send(utils.fmt_md_code(f"No maps found by '{creator}'."))
             return
-        the_maps.sort(key=lambda k: (k.game.name, k.displayname))
         cols = [MessageCol.Col("Map name", 30, lambda m: m.displayname),
                     MessageCol.Col("Creator", 35, lambda m: m.creator),
                     MessageCol.GAME,
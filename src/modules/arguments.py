@@ -124,6 +124,16 @@ class ArgumentValidator:
                 return False, f"{user.username} is pending moderation."
         return True, ""
     
+    async def invalid_map(self, map_name : str) -> str:
+        if self.game.value is not None:
+            err = f"\"{map_name}\" is not a valid {self.game.value} map."
+        else:
+            err = f"\"{map_name}\" is not a valid map."
+        suggestions = await self.strafes.suggest_maps(map_name, self.game.value)
+        if suggestions:
+            err += " Did you mean " + ", ".join(f"\"{m.displayname}\"" for m in suggestions) + "?"
+        return err
+
     async def evaluate(self, args : Iterable[str], author_id : int = None) -> Tuple[bool, str]:
         args = list(args)
         if not self.game.is_not_required():
@@ -179,10 +189,7 @@ class ArgumentValidator:
                     return False, "Map name is too long!"
                 smap = await self.strafes.map_from_name(map_name, self.game.value)
                 if not smap:
-                    if self.game.value is not None:
-                        return False, f"\"{map_name}\" is not a valid {self.game.value} map."
-                    else:
-                        return False, f"\"{map_name}\" is not a valid map."
+                    return False, await self.invalid_map(map_name)
             else:
                 smap = await self.strafes.map_from_name(" ".join(args), self.game.value)
                 if smap:
@@ -200,10 +207,7 @@ class ArgumentValidator:
                         if smap:
                             username = args[-1]
                         else:
-                            if self.game.value is not None:
-                                return False, f"\"{map_name}\" is not a valid {self.game.value} map."
-                            else:
-                                return False, f"\"{map_name}\" is not a valid map."
+                            return False, await self.invalid_map(map_name)
                     valid, err = await self.set_user(username, author_id)
                     if not valid:
                         return False, err
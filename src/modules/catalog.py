@@ -0,0 +1,240 @@
+# catalog.py
+import gzip
+import heapq
+import itertools
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from modules.strafes_base import Date, Game, Map
+
+# substring search over a fixed list of (lowercase) strings
+# every piece of up to n characters of each string maps to the positions of the strings that contain it,
+# so a search only has to look at the strings that contain every n character piece of the query
+class SubstringIndex:
+
+    def __init__(self, names : List[str], n : int = 3):
+        self.names = names
+        self.n = n
+        self._grams : Dict[str, Set[int]] = {}
+        for i, name in enumerate(names):
+            for size in range(1, n + 1):
+                for j in range(len(name) - size + 1):
+                    gram = name[j:j+size]
+                    postings = self._grams.get(gram)
+                    if postings is None:
+                        self._grams[gram] = {i}
+                    else:
+                        postings.add(i)
+
+    # positions of the strings that might contain query, always a superset of the real matches
+    def candidates(self, query : str) -> Iterable[int]:
+        if len(query) <= self.n:
+            return self._grams.get(query, ())
+        postings = []
+        for j in range(len(query) - self.n + 1):
+            gram = self._grams.get(query[j:j+self.n])
+            if gram is None:
+                return ()
+            postings.append(gram)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+    # positions of every string containing query, in order
+    def search(self, query : str) -> List[int]:
+        if not query:
+            return list(range(len(self.names)))
+        return sorted(i for i in self.candidates(query) if query in self.names[i])
+
+    # position of the shortest string containing query, the earliest one wins ties
+    def shortest(self, query : str) -> Optional[int]:
+        best = None
+        for i in self.search(query):
+            if best is None or len(self.names[i]) < len(self.names[best]):
+                best = i
+        return best
+
+# the set of trigrams in s, padded so the start and end of s count for more
+def trigrams(s : str) -> Set[str]:
+    s = f"  {s} "
+    return {s[i:i+3] for i in range(len(s) - 2)}
+
+# fuzzy search over a fixed list of (lowercase) strings
+# strings are scored by the trigrams they share with the query (dice coefficient, 1.0 is identical)
+class TrigramIndex:
+
+    def __init__(self, names : List[str]):
+        self.names = names
+        self._sizes : List[int] = []
+        self._grams : Dict[str, List[int]] = {}
+        for i, name in enumerate(names):
+            grams = trigrams(name)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                postings = self._grams.get(gram)
+                if postings is None:
+                    self._grams[gram] = [i]
+                else:
+                    postings.append(i)
+
+    # (score, position) of the closest strings to query, best first, the earliest one wins ties
+    def search(self, query : str, limit : int = 5, min_score : float = 0.3) -> List[Tuple[float, int]]:
+        grams = trigrams(query)
+        shared : Dict[int, int] = {}
+        for gram in grams:
+            for i in self._grams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        size = len(grams)
+        scores = []
+        for i, count in shared.items():
+            score = 2 * count / (size + self._sizes[i])
+            if score >= min_score:
+                scores.append((score, i))
+        return heapq.nlargest(limit, scores, key=lambda s: (s[0], -s[1]))
+
+# maps grouped by (lowercase) creator, searchable by any part of the creator's name
+# maps are kept sorted by (game, displayname) so results come back in display order
+class CreatorIndex:
+
+    def __init__(self, maps : Iterable[Map]):
+        self.maps = sorted(maps, key=lambda m: (m.game.name, m.displayname))
+        by_creator : Dict[str, List[int]] = {}
+        for i, map in enumerate(self.maps):
+            by_creator.setdefault(map.creator.lower(), []).append(i)
+        self._positions = list(by_creator.values())
+        self._index = SubstringIndex(list(by_creator))
+
+    def search(self, creator : str) -> List[Map]:
+        if not creator:
+            return list(self.maps)
+        creators = self._index.search(creator.lower())
+        positions = heapq.merge(*(self._positions[i] for i in creators))
+        return [self.maps[i] for i in positions]
+
+# ls should be sorted
+# performs an iterative binary search
+# returns the first index where the item was found according to the compare function
+def find_item(ls, compare) -> int:
+    left = 0
+    right = len(ls) - 1
+    while left <= right:
+        middle = (left + right) // 2
+        res = compare(ls[middle])
+        if res == 0:
+            return middle
+        elif res < 0:
+            left = middle + 1
+        else:
+            right = middle - 1
+    return -1
+
+def compare_maps(name : str, map_name : str) -> int:
+    if map_name.startswith(name):
+        return 0
+    elif map_name < name:
+        return -1
+    else:
+        return 1
+
+# the maps of one game sorted by lowercase name, with the name indexes built over them
+class GameMaps:
+
+    def __init__(self, maps : Iterable[Map]):
+        self.pairs : List[Tuple[str, Map]] = sorted(((map.displayname.lower(), map) for map in maps), key=lambda i: i[0])
+        self.name_index = SubstringIndex([name for name, _ in self.pairs])
+        self.fuzzy_index = TrigramIndex(self.name_index.names)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # finds the first map (alphabetically) starting with name, otherwise the map with the shortest name containing name
+    def from_name(self, name : str) -> Optional[Map]:
+        name = name.lower()
+        ls = self.pairs
+        idx = find_item(ls, lambda m : compare_maps(name, m[0]))
+        if idx != -1:
+            while idx > 0:
+                if ls[idx-1][0].startswith(name):
+                    idx -= 1
+                else:
+                    break
+            return ls[idx][1]
+        idx = self.name_index.shortest(name)
+        return ls[idx][1] if idx is not None else None
+
+    def suggest(self, name : str, limit : int) -> List[Tuple[float, Map]]:
+        return [(score, self.pairs[i][1]) for score, i in self.fuzzy_index.search(name.lower(), limit)]
+
+# snapshot of every map and the indexes over them
+# a catalog is never changed after it's built, reloads build a new one and swap it in
+# so readers never have to wait for (or lock against) a reload
+class MapCatalog:
+
+    def __init__(self, bhop_maps : Iterable[Map], surf_maps : Iterable[Map]):
+        self.bhop = GameMaps(bhop_maps)
+        self.surf = GameMaps(surf_maps)
+        self.lookup : Dict[int, Map] = {map.id: map for _, map in itertools.chain(self.bhop.pairs, self.surf.pairs)}
+        self.creator_index = CreatorIndex(self.lookup.values())
+
+    def _games(self, game : Optional[Game]) -> List[GameMaps]:
+        if game == Game.BHOP:
+            return [self.bhop]
+        elif game == Game.SURF:
+            return [self.surf]
+        elif game is None:
+            return [self.bhop, self.surf]
+        return []
+
+    def count(self, game : Game) -> int:
+        if game == Game.BHOP:
+            return len(self.bhop)
+        elif game == Game.SURF:
+            return len(self.surf)
+        else:
+            return 1
+
+    def map_from_name(self, name : str, game : Optional[Game]) -> Optional[Map]:
+        for maps in self._games(game):
+            res = maps.from_name(name)
+            if res is not None:
+                return res
+        return None
+
+    def suggest(self, name : str, game : Optional[Game], limit : int) -> List[Map]:
+        results = [result for maps in self._games(game) for result in maps.suggest(name, limit)]
+        results.sort(key=lambda r: -r[0])
+        return [map for _, map in results[:limit]]
+
+# bump this whenever the layout of a saved catalog changes, older files are then ignored
+CATALOG_VERSION = 1
+
+def _map_to_row(map : Map) -> list:
+    return [map.id, map.displayname, map.creator, map.game.value, map.date.timestamp, map.playcount, map.thumbnail]
+
+def _map_from_row(row : list) -> Map:
+    id, displayname, creator, game, date, playcount, thumbnail = row
+    return Map(id, displayname, creator, Game(game), Date(date), playcount, thumbnail)
+
+# saves the maps in a catalog as gzipped json
+# the file is written next to path and then moved over it, so a crash never leaves half a catalog behind
+def save_catalog(path : str, catalog : MapCatalog):
+    data = {
+        "version": CATALOG_VERSION,
+        "bhop": [_map_to_row(map) for _, map in catalog.bhop.pairs],
+        "surf": [_map_to_row(map) for _, map in catalog.surf.pairs]
+    }
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+        json.dump(data, file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+# returns None if there is no usable saved catalog (missing, corrupt or from another version)
+def load_catalog(path : str) -> Optional[MapCatalog]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get("version") != CATALOG_VERSION:
+            return None
+        return MapCatalog(map(_map_from_row, data["bhop"]), map(_map_from_row, data["surf"]))
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,103 @@
+# compare.py
+from typing import List
+
+import numpy as np
+
+MAX_COMPARE_USERS = 12
+
+# the outcome of comparing several users' times map by map
+# users are referred to by their index in the lists given to compare_times and times by their row in that user's arrays
+class CompareResult:
+
+    def __init__(self, user_count : int):
+        # wins[i]: rows of user i that are the single best time on their map
+        # runner_up_user[i] / runner_up_row[i]: who had the second best time on each of those maps, lined up with wins[i]
+        self.wins : List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(user_count)]
+        self.runner_up_user : List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(user_count)]
+        self.runner_up_row : List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(user_count)]
+        # maps where two or more users share the best time, given as the first of those users (by index) and their row
+        self.tie_user : np.ndarray = np.empty(0, dtype=np.int64)
+        self.tie_row : np.ndarray = np.empty(0, dtype=np.int64)
+        # exclusive[i]: rows of user i on maps nobody else completed
+        self.exclusive : List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(user_count)]
+
+# map_ids[i] and times[i] are user i's map ids and times (lined up), each user should have at most one time per map
+# (only their best time on a map counts if they have more)
+# everything is done with a couple of sorts over all users' times at once, so this scales with the total number of
+# times rather than with the number of pairs of users
+def compare_times(map_ids : List[np.ndarray], times : List[np.ndarray]) -> CompareResult:
+    user_count = len(map_ids)
+    result = CompareResult(user_count)
+    sizes = [len(ids) for ids in map_ids]
+    if sum(sizes) == 0:
+        return result
+    all_maps = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in map_ids])
+    all_times = np.concatenate([np.asarray(t, dtype=np.int64) for t in times])
+    owner = np.repeat(np.arange(user_count, dtype=np.int64), sizes)
+    row = np.concatenate([np.arange(size, dtype=np.int64) for size in sizes])
+
+    # keep only each user's best time on each map
+    order = np.lexsort((all_times, owner, all_maps))
+    all_maps, all_times, owner, row = all_maps[order], all_times[order], owner[order], row[order]
+    first = np.ones(len(all_maps), dtype=np.bool_)
+    first[1:] = (all_maps[1:] != all_maps[:-1]) | (owner[1:] != owner[:-1])
+    all_maps, all_times, owner, row = all_maps[first], all_times[first], owner[first], row[first]
+
+    # fastest first on each map, lower user index first on equal times
+    order = np.lexsort((owner, all_times, all_maps))
+    all_maps, all_times, owner, row = all_maps[order], all_times[order], owner[order], row[order]
+    starts = np.flatnonzero(np.concatenate(([True], all_maps[1:] != all_maps[:-1])))
+    counts = np.diff(np.append(starts, len(all_maps)))
+
+    alone = starts[counts == 1]
+    shared = starts[counts > 1]
+    tied = all_times[shared + 1] == all_times[shared]
+    ties = shared[tied]
+    won = shared[~tied]
+
+    result.tie_user = owner[ties]
+    result.tie_row = row[ties]
+    for i in range(user_count):
+        mine = won[owner[won] == i]
+        result.wins[i] = row[mine]
+        result.runner_up_user[i] = owner[mine + 1]
+        result.runner_up_row[i] = row[mine + 1]
+        result.exclusive[i] = row[alone[owner[alone] == i]]
+    return result
+
+# wins, ties and exclusive completions counted per style, for users compared in several styles at once
+# column k of each count is styles[k]
+class StyleMatrix:
+
+    def __init__(self, styles : List[int], user_count : int):
+        self.styles = styles
+        self.wins : np.ndarray = np.zeros((user_count, len(styles)), dtype=np.int64)
+        self.ties : np.ndarray = np.zeros(len(styles), dtype=np.int64)
+        self.exclusive : np.ndarray = np.zeros((user_count, len(styles)), dtype=np.int64)
+
+# like compare_times, but for users' times in many styles (map_ids[i], style_ids[i], times[i] lined up for user i)
+# times in styles not in styles are ignored
+# each (map, style) pair counts as its own map so every style is compared in a single compare_times
+def compare_styles(map_ids : List[np.ndarray], style_ids : List[np.ndarray], times : List[np.ndarray], styles : List[int]) -> StyleMatrix:
+    user_count = len(map_ids)
+    matrix = StyleMatrix(styles, user_count)
+    column_of = np.full(max(styles) + 1, -1, dtype=np.int64)
+    column_of[styles] = np.arange(len(styles))
+    keys = []
+    kept_times = []
+    columns = []
+    for ids, style, t in zip(map_ids, style_ids, times):
+        style = np.asarray(style, dtype=np.int64)
+        column = np.where(style < len(column_of), column_of[np.minimum(style, len(column_of) - 1)], -1)
+        keep = column >= 0
+        keys.append(np.asarray(ids, dtype=np.int64)[keep] * 256 + style[keep])
+        kept_times.append(np.asarray(t, dtype=np.int64)[keep])
+        columns.append(column[keep])
+    result = compare_times(keys, kept_times)
+    for i, column in enumerate(columns):
+        matrix.wins[i] = np.bincount(column[result.wins[i]], minlength=len(styles))
+        matrix.exclusive[i] = np.bincount(column[result.exclusive[i]], minlength=len(styles))
+    if len(result.tie_user) > 0:
+        offsets = np.cumsum([0] + [len(column) for column in columns])
+        matrix.ties = np.bincount(np.concatenate(columns)[offsets[result.tie_user] + result.tie_row], minlength=len(styles))
+    return matrix
@@ -0,0 +1,60 @@
+# compositing.py
+import colorsys
+import functools
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# pixels within this distance of a split line are drawn as the rainbow seam
+SEAM_WIDTH = 3
+
+# for a size x size image split diagonally into count parts:
+# region[i, j] is the image pixel (i, j) is taken from and seam[i, j] is whether it's on a seam instead
+# split k runs along i + j = round(k * 2 * size / count), so two images split along the anti-diagonal
+# these only depend on the size and count so they're built once and reused (don't modify them)
+@functools.lru_cache(maxsize=32)
+def split_masks(size : int, count : int) -> Tuple[np.ndarray, np.ndarray]:
+    diagonal = np.add.outer(np.arange(size), np.arange(size))
+    bounds = np.array([round(k * 2 * size / count) for k in range(1, count)], dtype=np.int64)
+    region = np.searchsorted(bounds, diagonal, side="left")
+    seam = np.zeros((size, size), dtype=np.bool_)
+    for bound in bounds:
+        seam |= np.abs(diagonal - bound) <= SEAM_WIDTH
+    region.flags.writeable = False
+    seam.flags.writeable = False
+    return region, seam
+
+# one RGBA color per row going once around the hue wheel from top to bottom, shape (size, 1, 4)
+@functools.lru_cache(maxsize=32)
+def rainbow_rows(size : int) -> np.ndarray:
+    colors = np.array([[*colorsys.hsv_to_rgb(i / size, 1, 1), 1] for i in range(size)]) * 255
+    rows = colors.astype(np.uint8).reshape(size, 1, 4)
+    rows.flags.writeable = False
+    return rows
+
+# combines images into one square image split diagonally between them (first image top left) with rainbow seams
+# every image is converted to RGBA and resized to size (default: the first image's width)
+def composite(images : List[Image.Image], size : Optional[int] = None) -> Image.Image:
+    if size is None:
+        size = images[0].width
+    pixels = []
+    for image in images:
+        image = image.convert("RGBA")
+        if image.size != (size, size):
+            image = image.resize((size, size))
+        pixels.append(np.asarray(image))
+    stack = np.stack(pixels)
+    region, seam = split_masks(size, len(images))
+    out = np.take_along_axis(stack, region[np.newaxis, :, :, np.newaxis], axis=0)[0]
+    out = np.where(seam[:, :, np.newaxis], rainbow_rows(size), out)
+    return Image.fromarray(out, "RGBA")
+
+# composite for encoded images (e.g. avatar headshots), returns the result as PNG
+# this is all cpu work so call it with asyncio.to_thread
+def composite_png(images : List[bytes], size : Optional[int] = None) -> bytes:
+    new_image = composite([Image.open(BytesIO(image)) for image in images], size)
+    with BytesIO() as image_binary:
+        new_image.save(image_binary, "PNG")
+        return image_binary.getvalue()
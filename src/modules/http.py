@@ -0,0 +1,530 @@
+# http.py
+import aiohttp
+import asyncio
+import collections
+from contextvars import ContextVar
+import datetime
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+import functools
+import heapq
+import itertools
+import json
+import math
+from multidict import CIMultiDict, CIMultiDictProxy
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Mapping, Optional, Set, Tuple, TypeVar
+from urllib.parse import urlencode, urlsplit
+
+T = TypeVar("T")
+
+def _header_float(headers : Mapping[str, str], name : str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+# priority used by requests that don't pass one explicitly, see with_priority
+request_priority : ContextVar[Priority] = ContextVar("request_priority", default=Priority.INTERACTIVE)
+
+# gives an async function a priority keyword argument which applies to every request made while it runs
+# (including from tasks it starts), leaving it out keeps the priority of the caller
+def with_priority(func : Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(func)
+    async def wrapper(*args, priority : Optional[Priority] = None, **kwargs) -> T:
+        if priority is None:
+            return await func(*args, **kwargs)
+        token = request_priority.set(priority)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            request_priority.reset(token)
+    return wrapper
+
+# token bucket that refills continuously at capacity / period tokens per second
+# waiting callers are queued by priority and then arrival order, so interactive requests always go out before background ones
+# background requests also leave background_reserve of the bucket untouched so a burst of background work can't
+# use up the budget right before a user runs a command
+# a request that can't get a token within its max wait is refused instead
+class RateLimiter:
+
+    def __init__(self, capacity : int = 100, period : float = 60.0, max_wait : float = 30.0, background_max_wait : float = 120.0, 
+            background_reserve : float = 0.2):
+        self.capacity : int = capacity
+        self.period : float = period
+        self.max_wait : float = max_wait
+        self.background_max_wait : float = background_max_wait
+        self.background_reserve : float = background_reserve
+        self._tokens : float = float(capacity)
+        self._last_refill : float = time.monotonic()
+        # (priority, arrival, deadline, future)
+        self._waiters : List[Tuple[int, int, float, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._dispatcher : Optional[asyncio.Task] = None
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.capacity), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    @property
+    def remaining(self) -> int:
+        self._refill()
+        return max(0, int(self._tokens))
+
+    # tokens that have to be left in the bucket after a request with this priority takes one
+    def _reserved(self, priority : int) -> float:
+        return self.capacity * self.background_reserve if priority >= Priority.BACKGROUND else 0.0
+
+    # seconds until a new request with this priority could be sent, ignoring anyone already waiting
+    def wait_time(self, priority : int = Priority.INTERACTIVE) -> float:
+        self._refill()
+        needed = 1 + self._reserved(priority)
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) / self.rate
+
+    # returns False if a token won't be available in time
+    async def acquire(self, priority : Optional[int] = None) -> bool:
+        if priority is None:
+            priority = request_priority.get()
+        max_wait = self.background_max_wait if priority >= Priority.BACKGROUND else self.max_wait
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority and not waiter[3].done())
+        if ahead == 0 and self.wait_time(priority) == 0:
+            self._tokens -= 1
+            return True
+        # everyone ahead of us needs a token first
+        if self.wait_time(priority) + ahead / self.rate > max_wait:
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), time.monotonic() + max_wait, fut))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        return await fut
+
+    # takes a token only if one is free right now and at least min_remaining of the bucket would be left,
+    # for optional extra requests that shouldn't wait or compete with anyone
+    def try_acquire(self, min_remaining : float = 0.0) -> bool:
+        if any(not waiter[3].done() for waiter in self._waiters):
+            return False
+        self._refill()
+        if self._tokens - 1 < self.capacity * min_remaining:
+            return False
+        self._tokens -= 1
+        return True
+
+    # hands out tokens to the waiters in order as the bucket refills
+    async def _dispatch(self):
+        while self._waiters:
+            priority, _, deadline, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            wait = self.wait_time(priority)
+            if wait == 0:
+                heapq.heappop(self._waiters)
+                self._tokens -= 1
+                fut.set_result(True)
+                continue
+            # anyone who won't get a token before their deadline is told now rather than later
+            for waiter in self._waiters:
+                if not waiter[3].done() and waiter[2] < now + wait:
+                    waiter[3].set_result(False)
+            if fut.done():
+                continue
+            await asyncio.sleep(wait)
+
+    # sync the bucket with the x-rate-limit-* headers of a response
+    def update(self, headers : Mapping[str, str]):
+        limit = _header_float(headers, "x-rate-limit-limit")
+        if limit is not None and limit > 0:
+            self.capacity = int(limit)
+        period = _header_float(headers, "x-rate-limit-burst")
+        if period is not None and period > 0:
+            self.period = period
+        self._refill()
+        remaining = _header_float(headers, "x-rate-limit-remaining")
+        if remaining is not None:
+            # our own requests that are still in flight aren't counted by the server yet,
+            # so only ever lower our count to match it
+            self._tokens = min(self._tokens, remaining)
+
+    # called when the server says we're over the limit anyway
+    def drain(self, retry_after : Optional[float] = None):
+        self._refill()
+        if retry_after is not None and retry_after > 0:
+            self._tokens = min(self._tokens, 1 - retry_after * self.rate)
+        else:
+            self._tokens = min(self._tokens, 0.0)
+
+    def info(self) -> Tuple[int, int]:
+        return self.remaining, math.ceil(self.wait_time())
+
+# coalesces concurrent calls with the same key into a single call
+# every caller gets the same result (or exception), so results must be treated as read-only
+# the call is cancelled once every caller waiting on it has been cancelled
+class SingleFlight:
+
+    class _Call:
+
+        def __init__(self, fut : asyncio.Future):
+            self.fut = fut
+            self.waiters = 0
+
+    def __init__(self):
+        self._calls : Dict[Hashable, SingleFlight._Call] = {}
+
+    async def do(self, key : Hashable, func : Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = SingleFlight._Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.fut.add_done_callback(lambda f: self._forget(key, call))
+        call.waiters += 1
+        try:
+            # shield so one caller giving up doesn't cancel the request for the others still waiting on it
+            return await asyncio.shield(call.fut)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.fut.done():
+                # nobody wants the result anymore, stop the request (and don't hand it to new callers)
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.fut.cancel()
+
+    def _forget(self, key : Hashable, call : "SingleFlight._Call"):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # avoid "exception was never retrieved" warnings if every caller was cancelled
+        if not call.fut.cancelled():
+            call.fut.exception()
+
+def freeze_params(params : Mapping[str, Any]) -> Tuple:
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value) for key, value in params.items()))
+
+# stands in for an aiohttp.ClientResponse when the body is served from the cache,
+# only the parts callers look at afterwards (status, url and headers) are kept
+class CachedResponse:
+
+    def __init__(self, url : str, status : int, headers : Mapping[str, str]):
+        self.url = url
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+
+    def __repr__(self):
+        return f"<CachedResponse({self.url}) [{self.status}]>"
+
+class CacheEntry:
+
+    def __init__(self, etag : Optional[str], last_modified : Optional[str], headers : Dict[str, str], body : str):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.body = body
+
+    # headers to send so the server can answer with a 304 if the body hasn't changed
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+# on-disk store of response bodies along with their ETag / Last-Modified validators
+# sqlite calls are blocking so they're run in a worker thread
+# rows older than max_age are dropped (along with the oldest rows past max_rows) on startup and every prune_every sets
+# the keys that have a row are also kept in memory, so a lookup for anything else (e.g. an endpoint that never
+# sends validators) doesn't need the thread at all
+class ResponseCache:
+
+    def __init__(self, path : str, max_age : float = 7*24*60*60, max_rows : int = 20000, prune_every : int = 500):
+        self.path = path
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._conn : Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._sets_since_prune = 0
+        # None until loaded by the first get
+        self._keys : Optional[Set[str]] = None
+
+    @staticmethod
+    def make_key(url : str, params : Mapping[str, Any]) -> str:
+        return f"{url}?{urlencode(freeze_params(params), doseq=True)}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, headers TEXT, body TEXT, stored_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+            self._prune(conn)
+            self._conn = conn
+        return self._conn
+
+    # deletes expired rows and then the oldest rows over max_rows, returns the deleted keys
+    def _prune(self, conn : sqlite3.Connection) -> List[str]:
+        cutoff = time.time() - self.max_age
+        removed = [row[0] for row in conn.execute("SELECT key FROM responses WHERE stored_at < ?", (cutoff,))]
+        removed += [row[0] for row in conn.execute("SELECT key FROM responses WHERE stored_at >= ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?", 
+            (cutoff, self.max_rows))]
+        conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in removed])
+        conn.commit()
+        return removed
+
+    def _load_keys(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._connect().execute("SELECT key FROM responses")}
+
+    def _get(self, key : str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._connect().execute("SELECT etag, last_modified, headers, body FROM responses WHERE key = ? AND stored_at >= ?", 
+                (key, time.time() - self.max_age)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(row[0], row[1], json.loads(row[2]), row[3])
+
+    # returns the keys deleted if this set was the one to prune
+    def _set(self, key : str, entry : CacheEntry) -> List[str]:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", 
+                (key, entry.etag, entry.last_modified, json.dumps(entry.headers), entry.body, time.time()))
+            conn.commit()
+            self._sets_since_prune += 1
+            if self._sets_since_prune < self.prune_every:
+                return []
+            self._sets_since_prune = 0
+            return self._prune(conn)
+
+    def _touch(self, key : str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # a broken cache should never break a request, so sqlite errors are treated as a miss
+    async def get(self, key : str) -> Optional[CacheEntry]:
+        try:
+            if self._keys is None:
+                self._keys = await asyncio.to_thread(self._load_keys)
+            if key not in self._keys:
+                return None
+            return await asyncio.to_thread(self._get, key)
+        except (sqlite3.Error, ValueError):
+            return None
+
+    async def set(self, key : str, entry : CacheEntry):
+        try:
+            removed = await asyncio.to_thread(self._set, key, entry)
+        except sqlite3.Error:
+            return
+        if self._keys is not None:
+            self._keys.add(key)
+            self._keys.difference_update(removed)
+
+    # keeps an entry from expiring after it was revalidated
+    async def touch(self, key : str):
+        try:
+            await asyncio.to_thread(self._touch, key)
+        except sqlite3.Error:
+            pass
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+        self._keys = None
+
+# Retry-After is either a number of seconds or an HTTP date
+def parse_retry_after(value : Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+# max_attempts: total number of tries including the first one
+# backoff_base: delay before the first retry, doubled for every retry after that (capped at backoff_max)
+# jitter: fraction of the delay that is randomized so retries from parallel requests don't line up
+# retry_statuses: response statuses worth retrying, timeouts and connection errors are always retried
+# methods: only these methods are retried, anything that isn't safe to send twice should stay out of here
+# max_retry_after: give up instead of waiting if the server asks us to come back later than this
+class RetryPolicy:
+
+    def __init__(self, max_attempts : int = 3, backoff_base : float = 0.5, backoff_max : float = 8.0, jitter : float = 0.5, 
+            retry_statuses : Iterable[int] = (429, 500, 502, 503, 504), methods : Iterable[str] = ("GET", "DELETE"), max_retry_after : float = 30.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.max_retry_after = max_retry_after
+
+    # status is None for timeouts and connection errors
+    # returns how long to wait before trying again or None if we shouldn't retry
+    def next_delay(self, method : str, attempt : int, status : Optional[int], retry_after : Optional[float] = None) -> Optional[float]:
+        if attempt >= self.max_attempts or method.upper() not in self.methods:
+            return None
+        if status is not None and status not in self.retry_statuses:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            return retry_after
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+# connection pool settings for the aiohttp sessions used by StrafesClient, read from the HTTP_POOL section of config.json
+# limit: max open connections per session, limit_per_host: max open connections to a single host
+# keepalive_timeout: seconds an idle connection is kept around for reuse, dns_cache_ttl: seconds a dns lookup is reused
+# separate_sessions: give every upstream host its own session and pool so a big fan-out to one host can't starve the others
+# hosts: per host overrides of the above settings, only used with separate_sessions
+class PoolConfig:
+
+    def __init__(self, limit : int = 100, limit_per_host : int = 10, keepalive_timeout : float = 30.0, dns_cache_ttl : Optional[int] = 300, 
+            timeout : float = 20.0, separate_sessions : bool = False, hosts : Optional[Dict[str, "PoolConfig"]] = None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.separate_sessions = separate_sessions
+        self.hosts : Dict[str, PoolConfig] = hosts if hosts is not None else {}
+
+    @staticmethod
+    def from_dict(d : Optional[Dict[str, Any]], base : Optional["PoolConfig"] = None) -> "PoolConfig":
+        d = d or {}
+        base = base or PoolConfig()
+        config = PoolConfig(
+            d.get("LIMIT", base.limit),
+            d.get("LIMIT_PER_HOST", base.limit_per_host),
+            d.get("KEEPALIVE_TIMEOUT", base.keepalive_timeout),
+            d.get("DNS_CACHE_TTL", base.dns_cache_ttl),
+            d.get("TIMEOUT", base.timeout),
+            d.get("SEPARATE_SESSIONS", base.separate_sessions)
+        )
+        for host, overrides in d.get("HOSTS", {}).items():
+            config.hosts[host.lower()] = PoolConfig.from_dict(overrides, config)
+        return config
+
+    def for_host(self, host : str) -> "PoolConfig":
+        return self.hosts.get(host.lower(), self)
+
+    def make_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl is not None,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+# hands out the session to use for a url, sessions are created on first use
+class SessionPool:
+
+    def __init__(self, config : PoolConfig):
+        self.config = config
+        self._sessions : Dict[str, aiohttp.ClientSession] = {}
+
+    def get(self, url : str) -> aiohttp.ClientSession:
+        host = (urlsplit(url).hostname or "").lower() if self.config.separate_sessions else ""
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            session = self.config.for_host(host).make_session()
+            self._sessions[host] = session
+        return session
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+# fires a second copy of a slow idempotent request and takes whichever answers first
+# the hedge is sent once the first request has been running longer than the given percentile of recent latencies
+# (clamped to min_delay..max_delay, max_delay is used until there are min_samples latencies)
+# at most budget of the last window requests may be hedged, and none are while the api's rate limiter has
+# less than min_remaining of its capacity left
+class HedgePolicy:
+
+    def __init__(self, percentile : float = 0.95, min_delay : float = 0.1, max_delay : float = 2.0, window : int = 200, 
+            min_samples : int = 20, budget : float = 0.1, min_remaining : float = 0.5):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.min_remaining = min_remaining
+        self._latencies : Deque[float] = collections.deque(maxlen=window)
+        self._hedged : Deque[bool] = collections.deque(maxlen=window)
+
+    def delay(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.max_delay
+        latencies = sorted(self._latencies)
+        value = latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def record(self, latency : float, hedged : bool):
+        self._latencies.append(latency)
+        self._hedged.append(hedged)
+
+    def can_hedge(self, limiter : Optional[RateLimiter]) -> bool:
+        if sum(self._hedged) >= self.budget * self._hedged.maxlen:
+            return False
+        return limiter is None or limiter.try_acquire(self.min_remaining)
+
+    async def run(self, send : Callable[[], Awaitable[T]], limiter : Optional[RateLimiter] = None) -> T:
+        start = time.monotonic()
+        first = asyncio.ensure_future(send())
+        tasks = {first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+            if not done and self.can_hedge(limiter):
+                hedged = True
+                tasks.add(asyncio.ensure_future(send()))
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.record(time.monotonic() - start, hedged)
+                        return task.result()
+                if not tasks:
+                    # everything failed, report the original request's error
+                    return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,119 @@
+# record_batch.py
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from modules.strafes_base import Date, Game, Map, Record, Style, Time, User
+from modules.utils import utc2local_batch
+
+RECORD_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("map", np.int64),
+    ("time", np.int64),
+    ("date", np.int64),
+    ("style", np.int16),
+    ("mode", np.int16),
+    ("game", np.int16),
+    ("has_bot", np.bool_),
+    ("name", np.int32) # index into the batch's names
+])
+
+# a user's times stored as columns (one structured numpy array) instead of Record objects
+# sorting, filtering and grouping work on the whole array at once and Record objects are only built for
+# the rows that are actually shown (see materialize)
+# map names are kept once each in a shared string table that every slice of the batch points into
+class RecordBatch:
+
+    def __init__(self, data : np.ndarray, names : List[str], user : User):
+        self.data = data
+        self.names = names
+        self.user = user
+
+    @staticmethod
+    def from_dicts(records : List[Dict[str, Any]], user : User) -> "RecordBatch":
+        names : List[str] = []
+        name_lookup : Dict[str, int] = {}
+        name_idxs = []
+        for record in records:
+            name = record["map"]["display_name"]
+            idx = name_lookup.get(name)
+            if idx is None:
+                idx = name_lookup[name] = len(names)
+                names.append(name.replace(u'\u200a', ' '))
+            name_idxs.append(idx)
+        data = np.empty(len(records), dtype=RECORD_DTYPE)
+        data["id"] = [record["id"] for record in records]
+        data["map"] = [record["map"]["id"] for record in records]
+        data["time"] = [record["time"] for record in records]
+        data["date"] = utc2local_batch([record["date"] for record in records])
+        data["style"] = [record["style_id"] for record in records]
+        data["mode"] = [record["mode_id"] for record in records]
+        data["game"] = [record["game_id"] for record in records]
+        data["has_bot"] = [record["has_bot"] for record in records]
+        data["name"] = name_idxs
+        return RecordBatch(data, names, user)
+
+    def __len__(self):
+        return len(self.data)
+
+    # key can be a slice, a boolean mask or an array of indices
+    def __getitem__(self, key : Union[slice, np.ndarray]) -> "RecordBatch":
+        return RecordBatch(self.data[key], self.names, self.user)
+
+    # sort_by is one of "date" (newest first), "time" (fastest first) or "name" (map name)
+    # ties are broken by newest date first
+    def sort(self, sort_by : str) -> "RecordBatch":
+        newest_first = -self.data["date"]
+        if sort_by == "date":
+            order = np.argsort(newest_first, kind="stable")
+        elif sort_by == "time":
+            order = np.lexsort((newest_first, self.data["time"]))
+        elif sort_by == "name":
+            order = np.lexsort((newest_first, self._name_ranks()[self.data["name"]]))
+        else:
+            raise ValueError(f"Unknown sort '{sort_by}'")
+        return self[order]
+
+    # position of each name in the string table when sorted alphabetically
+    def _name_ranks(self) -> np.ndarray:
+        ranks = np.empty(len(self.names), dtype=np.int32)
+        ranks[sorted(range(len(self.names)), key=self.names.__getitem__)] = np.arange(len(self.names), dtype=np.int32)
+        return ranks
+
+    def filter(self, game : Optional[Game] = None, style : Optional[Style] = None, map_id : Optional[int] = None) -> "RecordBatch":
+        mask = np.ones(len(self.data), dtype=np.bool_)
+        if game is not None:
+            mask &= self.data["game"] == game.value
+        if style is not None:
+            mask &= self.data["style"] == style.value
+        if map_id is not None:
+            mask &= self.data["map"] == map_id
+        return self[mask]
+
+    # the distinct map ids in the batch (sorted)
+    def map_ids(self) -> np.ndarray:
+        return np.unique(self.data["map"])
+
+    # splits the batch into one batch per map, each keeping the current row order
+    def group_by_map(self) -> Dict[int, "RecordBatch"]:
+        order = np.argsort(self.data["map"], kind="stable")
+        sorted_maps = self.data["map"][order]
+        ids, starts = np.unique(sorted_maps, return_index=True)
+        groups = np.split(order, starts[1:])
+        return {int(map_id): self[group] for map_id, group in zip(ids, groups)}
+
+    # builds Record objects for every row
+    # maps are looked up by id in maps if given, otherwise one placeholder Map is made per distinct map
+    def materialize(self, maps : Optional[Dict[int, Map]] = None) -> List[Record]:
+        map_cache : Dict[int, Map] = {}
+        records = []
+        for row in self.data.tolist():
+            id, map_id, time, date, style, mode, game, has_bot, name = row
+            map = map_cache.get(map_id)
+            if map is None:
+                map = maps.get(map_id) if maps is not None else None
+                if map is None:
+                    map = Map(map_id, self.names[name], "", Game(game), Date(0), 0, None)
+                map_cache[map_id] = map
+            records.append(Record(id, Time(time), self.user, map, Date(date), Style(style), mode, Game(game), has_bot))
+        return records
@@ -1,16 +1,22 @@
 # strafes.py
 from aiocache import cached, SimpleMemoryCache
 import aiohttp
-from aiorwlock import RWLock
 import asyncio
+import collections
 import json
 from enum import IntEnum
+import functools
+import itertools
 import random
 import time
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union, TypeVar
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union, TypeVar
 
+from modules.catalog import MapCatalog, load_catalog, save_catalog
+from modules.http import CacheEntry, CachedResponse, HedgePolicy, PoolConfig, RateLimiter, ResponseCache, RetryPolicy, SessionPool, SingleFlight, freeze_params, parse_retry_after, with_priority
+from modules.record_batch import RecordBatch
 from modules.strafes_base import *
-from modules.utils import Incrementer, fix_path, open_json, between, utc2local
+from modules.utils import bounded_gather, fix_path, open_json, write_json, between, utc2local, utc2local_batch
 
 T = TypeVar("T")
 
@@ -108,54 +114,243 @@ async def response_handler(res : aiohttp.ClientResponse, url : str, api_name : s
     except aiohttp.ContentTypeError:
         raise APIError(url, headers, params, res.status, await res.text(), api_name)
 
+# remembers how many pages a paginated endpoint has and how long its last page is for a short time,
+# so converting to our own page sizes doesn't have to fetch the last page again on every call
+# keys are the url and params of a request without the page number
+# entries are kept in the order they were set, which (with a fixed ttl) is also the order they expire in,
+# so expired entries are dropped from the front on every set and at most max_entries are kept
+class PageInfoCache:
+
+    def __init__(self, ttl : float = 120.0, max_entries : int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries : Dict[Tuple[str, Tuple], Tuple[int, int, float]] = {}
+
+    @staticmethod
+    def _make_key(url : str, params : Dict[str, Any]) -> Tuple[str, Tuple]:
+        return url, freeze_params({key: value for key, value in params.items() if key != "page"})
+
+    # returns (page count, last page length)
+    def get(self, url : str, params : Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        key = self._make_key(url, params)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        page_count, last_page_length, expires = entry
+        if time.monotonic() > expires:
+            del self._entries[key]
+            return None
+        return page_count, last_page_length
+
+    def set(self, url : str, params : Dict[str, Any], page_count : int, last_page_length : int):
+        key = self._make_key(url, params)
+        now = time.monotonic()
+        # re-setting a key moves it to the back
+        self._entries.pop(key, None)
+        self._entries[key] = (page_count, last_page_length, now + self.ttl)
+        self._prune(now)
+
+    def _prune(self, now : float):
+        expired = []
+        for key, (_, _, expires) in self._entries.items():
+            if expires >= now:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self, url : str, params : Dict[str, Any]):
+        self._entries.pop(self._make_key(url, params), None)
+
+    # predicate is given the url and params (without the page) of every entry
+    def invalidate_matching(self, predicate : Callable[[str, Dict[str, Any]], bool]):
+        for key in [key for key in self._entries if predicate(key[0], dict(key[1]))]:
+            del self._entries[key]
+
+# a list of wrs (as returned by the fiveman1 strafes api) indexed by record id and by course (map, style, game)
+class WRSet:
+
+    def __init__(self, wrs : List[Dict[str, Any]]):
+        self.wrs = wrs
+        self.by_id : Dict[int, Dict[str, Any]] = {}
+        self.by_course : Dict[Tuple[int, int, int], Dict[str, Any]] = {}
+        # the list is newest first, so keep the first (newest) wr for each key
+        for wr in wrs:
+            self.by_id.setdefault(wr["id"], wr)
+            self.by_course.setdefault(WRSet.course(wr), wr)
+
+    @staticmethod
+    def course(wr : Dict[str, Any]) -> Tuple[int, int, int]:
+        return wr["map"]["id"], wr["style_id"], wr["game_id"]
+
+    # the wr that wr replaced, if it's in this set
+    def previous(self, wr : Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        #records by the same person on the same map have the same id even if they beat it
+        match = self.by_id.get(wr["id"])
+        if match is None:
+            match = self.by_course.get(WRSet.course(wr))
+        return match
+
 class StrafesClient:
-    def __init__(self, strafes_key : str, verify_key : str):
+    def __init__(self, strafes_key : str, verify_key : str, cache_path : Optional[str] = "files/http_cache.db", 
+            retry_policies : Optional[Dict[str, RetryPolicy]] = None, pool_config : Optional[PoolConfig] = None, max_concurrency : int = 6, 
+            hedge_policies : Optional[Dict[str, Optional[HedgePolicy]]] = None, catalog_path : Optional[str] = "files/map_catalog.json.gz"):
         self._strafes_headers = {"X-API-Key" : strafes_key}
         self._verify_headers = {"api-key": verify_key}
-        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=20))
-        self._bhop_map_pairs : List[Tuple[str, Map]] = []
-        self._surf_map_pairs : List[Tuple[str, Map]] = []
-        self._bhop_map_count : int = 0
-        self._surf_map_count : int = 0
-        self._map_lookup : Dict[int, Map] = {}
-        self._maps_loaded : bool = False
-        self._map_lock = RWLock()
-        self._ratelimit_lock = asyncio.Lock()
-        self._ratelimit_remaining : int = 100
-        self._ratelimit_reset : int = 60
-        self._last_strafes_response : float = None
+        self._sessions = SessionPool(pool_config or PoolConfig())
+        self._catalog : Optional[MapCatalog] = None
+        self._catalog_path : Optional[str] = fix_path(catalog_path) if catalog_path else None
+        # one shared User/Map per id for as long as anything still uses it, see _intern_user and _intern_map
+        self._users : weakref.WeakValueDictionary[int, User] = weakref.WeakValueDictionary()
+        self._maps : weakref.WeakValueDictionary[int, Map] = weakref.WeakValueDictionary()
+        # the wrs from the last get_new_wrs/write_wrs, also saved to RECENT_WRS_PATH so they survive restarts
+        self._recent_wrs : Optional[WRSet] = None
+        # the roblox apis don't publish their limits, so theirs are generous local budgets
+        # they're mostly there so hedged requests (see _hedge_policies) stop once half of one is used up
+        roblox_thumbnails = RateLimiter(capacity=300, period=60.0, max_wait=30.0)
+        self._ratelimiters : Dict[str, RateLimiter] = {
+            "strafes.net": RateLimiter(capacity=100, period=60.0, max_wait=30.0),
+            "Roblox Users": RateLimiter(capacity=300, period=60.0, max_wait=30.0),
+            "Roblox Avatar": roblox_thumbnails,
+            "Roblox Asset": roblox_thumbnails
+        }
+        # keyed by api name, anything not listed uses the default policy
+        self._retry_policies : Dict[str, RetryPolicy] = {
+            # the roblox user lookups that use POST are reads so they're safe to repeat
+            "Roblox Users": RetryPolicy(methods=("GET", "POST")),
+            # starting a verification is a GET but it makes a new phrase every time
+            "Verification": RetryPolicy(max_attempts=1)
+        }
+        if retry_policies:
+            self._retry_policies.update(retry_policies)
+        self._default_retry_policy = RetryPolicy()
+        # GETs to these apis are hedged, the roblox apis have an occasional very slow response that holds up the whole command
+        self._hedge_policies : Dict[str, Optional[HedgePolicy]] = {
+            "Roblox Users": HedgePolicy(),
+            "Roblox Avatar": HedgePolicy(),
+            "Roblox Asset": HedgePolicy()
+        }
+        if hedge_policies:
+            self._hedge_policies.update(hedge_policies)
+        self._inflight = SingleFlight()
+        # max number of pages fetched at once by a single call
+        self._max_concurrency = max_concurrency
+        self._page_info = PageInfoCache()
+        self._http_cache : Optional[ResponseCache] = ResponseCache(fix_path(cache_path)) if cache_path else None
         self._discord_user_cache = SimpleMemoryCache()
 
     async def close(self):
-        await self._session.close()
+        await self._sessions.close()
+        if self._http_cache is not None:
+            await self._http_cache.close()
 
+    # identical GETs that are in flight at the same time share one upstream call and one result,
+    # headers are compared by identity since they're always one of the dicts stored on the client
+    # (a shared call keeps the priority of whoever started it)
+    @staticmethod
+    def _request_key(url : str, params, headers, callback) -> Tuple:
+        return (url, freeze_params(params), id(headers), callback)
+
+    # sends a request built by send() until it succeeds or the retry policy for the api gives up
+    # every attempt waits for the api's rate limiter (if it has one) at the current request priority
+    # and feeds the response headers back into it
+    async def _request(self, method : str, url : str, api_name : str, params, headers, send : Callable[[], Awaitable[T]]) -> T:
+        policy = self._retry_policies.get(api_name, self._default_retry_policy)
+        limiter = self._ratelimiters.get(api_name)
+        hedge = self._hedge_policies.get(api_name) if method == "GET" else None
+        attempt = 1
+        while True:
+            if limiter is not None and not await limiter.acquire():
+                raise RateLimitError(url, headers, params, "n/a", "n/a", api_name, 
+                    f"Rate limit exceeded using the {api_name} API, please wait {limiter.info()[1]} seconds.")
+            status = None
+            retry_after = None
+            try:
+                result = await send() if hedge is None else await hedge.run(send, limiter)
+                if limiter is not None and getattr(result, "res", None) is not None:
+                    limiter.update(result.res.headers)
+                return result
+            except asyncio.TimeoutError:
+                error = TimeoutError(self._sessions.get(url).timeout.total, url, headers, params, api_name)
+            except aiohttp.ClientConnectionError as err:
+                error = err
+            except (APIError, NotFoundError) as err:
+                error = err
+                if err.res is not None:
+                    if limiter is not None:
+                        limiter.update(err.res.headers)
+                    retry_after = parse_retry_after(err.res.headers.get("Retry-After"))
+                if isinstance(err, NotFoundError):
+                    raise
+                status = err.status if isinstance(err.status, int) else None
+                if isinstance(err, RateLimitError) and limiter is not None:
+                    limiter.drain(retry_after)
+            delay = policy.next_delay(method, attempt, status, retry_after)
+            if delay is None:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @with_priority
     async def get_request(self, url : str, api_name : str, params={}, headers={}, 
             callback : Callable[[aiohttp.ClientResponse, str, str, Any, Any], Awaitable[T]] = response_handler) -> T:
-        try:
-            async with self._session.get(url, headers=headers, params=params) as res:
-                return await callback(res, url, api_name, params, headers)
-        except asyncio.TimeoutError:
-            raise TimeoutError(self._session.timeout.total, url, headers, params, api_name)
-
+        params = params.copy()
+        return await self._inflight.do(self._request_key(url, params, headers, callback), 
+            lambda: self._request("GET", url, api_name, params, headers, lambda: self._get_once(url, api_name, params, headers, callback)))
+
+    async def _get_once(self, url : str, api_name : str, params, headers, 
+            callback : Callable[[aiohttp.ClientResponse, str, str, Any, Any], Awaitable[T]]) -> T:
+        if self._http_cache is not None and callback is response_handler:
+            return await self._cached_get(url, api_name, params, headers)
+        async with self._sessions.get(url).get(url, headers=headers, params=params) as res:
+            return await callback(res, url, api_name, params, headers)
+
+    # if we have a stored copy of the response, ask the server to revalidate it with If-None-Match / If-Modified-Since
+    # a 304 is answered from the cache and a successful response with an ETag or Last-Modified replaces the stored copy
+    async def _cached_get(self, url : str, api_name : str, params, headers) -> JSONRes:
+        key = ResponseCache.make_key(url, params)
+        entry = await self._http_cache.get(key)
+        request_headers = headers if entry is None else {**headers, **entry.validators()}
+        async with self._sessions.get(url).get(url, headers=request_headers, params=params) as res:
+            if entry is not None and res.status == 304:
+                await self._http_cache.touch(key)
+                # the 304 carries fresh rate limit headers, everything else comes from the stored response
+                cached_headers = dict(entry.headers)
+                for name, value in res.headers.items():
+                    if name.lower() != "content-length":
+                        cached_headers[name] = value
+                return JSONRes(CachedResponse(str(res.url), 200, cached_headers), json.loads(entry.body))
+            data = await response_handler(res, url, api_name, params, headers)
+            etag = res.headers.get("ETag")
+            last_modified = res.headers.get("Last-Modified")
+            if etag or last_modified:
+                await self._http_cache.set(key, CacheEntry(etag, last_modified, dict(res.headers), json.dumps(data.json)))
+            return data
+
+    @with_priority
     async def post_request(self, url : str, api_name : str, data={}, headers={}, 
             callback : Callable[[aiohttp.ClientResponse, str, str, Any, Any], Awaitable[T]] = response_handler) -> T:
-        try:
-            async with self._session.post(url, headers=headers, json=data) as res:
+        async def send():
+            async with self._sessions.get(url).post(url, headers=headers, json=data) as res:
                 return await callback(res, url, api_name, data, headers)
-        except asyncio.TimeoutError:
-            raise TimeoutError(self._session.timeout.total, url, headers, data, api_name)
+        return await self._request("POST", url, api_name, data, headers, send)
     
+    @with_priority
     async def delete_request(self, url : str, api_name : str, headers={}, 
             callback : Callable[[aiohttp.ClientResponse, str, str, Any, Any], Awaitable[T]] = response_handler) -> T:
-        try:
-            async with self._session.delete(url, headers=headers) as res:
+        async def send():
+            async with self._sessions.get(url).delete(url, headers=headers) as res:
                 return await callback(res, url, api_name, {}, headers)
-        except asyncio.TimeoutError:
-            raise TimeoutError(self._session.timeout.total, url, headers, {}, api_name)
+        return await self._request("DELETE", url, api_name, {}, headers, send)
 
     async def get_bytes(self, url):
         try:
-            async with self._session.get(url) as res:
+            async with self._sessions.get(url).get(url) as res:
                 if res.status == 404:
                     raise NotFoundError()
                 elif res.status < 200 or res.status >= 300:
@@ -166,213 +361,180 @@ class StrafesClient:
                     raise APIError(url, {}, {}, res.status, body, None, f"Error occurred attempting to download {url}")
                 return await res.read()
         except asyncio.TimeoutError:
-            raise TimeoutError(self._session.timeout.total, url, {}, {}, None, f"Timeout occurred attempting to download {url}")
-
-    async def update_ratelimit_info(self, res : aiohttp.ClientResponse):
-        reset = int(res.headers["x-rate-limit-burst"])
-        now = time.monotonic()
-        async with self._ratelimit_lock:
-            if self._last_strafes_response is None or now - self._last_strafes_response > self._ratelimit_reset:
-                self._ratelimit_remaining = 99
-            else:
-                self._ratelimit_remaining = max(0, self._ratelimit_remaining - 1)
-            self._ratelimit_reset = reset
-            self._last_strafes_response = now
-
-    async def _get_strafes(self, end_of_url, params={}) -> JSONRes:
-        try:
-            data = await self.get_request(f"https://api.strafes.net/api/v1/{end_of_url}", "strafes.net", params, self._strafes_headers)
-            #await self.update_ratelimit_info(data.res)
-        except TimeoutError:
-            raise
-        except APIError as err:
-            #await self.update_ratelimit_info(err.res)
-            raise
-        except NotFoundError as err:
-            #await self.update_ratelimit_info(err.res)
-            raise
-        return data
+            raise TimeoutError(self._sessions.get(url).timeout.total, url, {}, {}, None, f"Timeout occurred attempting to download {url}")
 
+    # the returned JSONRes may be shared with other callers, don't modify its json in place
+    @with_priority
     async def get_strafes(self, end_of_url, params={}) -> JSONRes:
         try:
-            data = await self._get_strafes(end_of_url, params)
+            return await self.get_request(f"https://api.strafes.net/api/v1/{end_of_url}", "strafes.net", params, self._strafes_headers)
         except RateLimitError as err:
-            async with self._ratelimit_lock:
-                reset = self._ratelimit_reset
-            raise RateLimitError(err.url, err.headers, err.params, err.status, err.body, "strafes.net", f"Rate limit exceeded using the strafes.net API, please wait {reset} seconds.")
-        return data
-
-    async def get_ratelimit_info(self) -> Tuple[int, int]:
-        now = time.monotonic()
-        async with self._ratelimit_lock:
-            if self._last_strafes_response is None:
-                return self._ratelimit_remaining, self._ratelimit_reset
-            diff = now - self._last_strafes_response
-            if diff > self._ratelimit_reset:
-                self._ratelimit_remaining = 100
-                self._ratelimit_reset = 60
-                self._last_strafes_response = now
-            return self._ratelimit_remaining, self._ratelimit_reset - int(diff)
-
-    async def _map_mapper(self, game : Game, page : int):
-        res = self.get_strafes("map", {
-            "game":game.value,
-            "page":page
-        })
-        return game, await res
-
+            _, reset = self.get_ratelimit_info()
+            raise RateLimitError(err.url, err.headers, err.params, err.status, err.body, "strafes.net", f"Rate limit exceeded using the strafes.net API, please wait {reset} seconds.", err.res)
+
+    # returns the number of requests left and the number of seconds until the next one can be sent
+    def get_ratelimit_info(self) -> Tuple[int, int]:
+        return self._ratelimiters["strafes.net"].info()
+
+    # yields the json of every page of a paginated strafes.net endpoint in order,
+    # up to max_concurrency of the following pages are fetched while the caller works on the current one
+    async def _iter_pages(self, url : str, params : Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+        params = params.copy()
+        params["page"] = 1
+        first_page_res = await self.get_strafes(url, params)
+        if len(first_page_res.json) == 0:
+            return
+        page_count = int(first_page_res.res.headers["Pagination-Count"])
+        yield first_page_res.json
+        pending : Deque[asyncio.Future] = collections.deque()
+        next_page = 2
+        try:
+            while next_page <= page_count or pending:
+                while next_page <= page_count and len(pending) < self._max_concurrency:
+                    params_copy = params.copy()
+                    params_copy["page"] = next_page
+                    pending.append(asyncio.ensure_future(self.get_strafes(url, params_copy)))
+                    next_page += 1
+                res : JSONRes = await pending.popleft()
+                yield res.json
+        finally:
+            # the caller stopped early or something failed, don't leave requests running
+            for task in pending:
+                task.cancel()
+
+    # yields every map of a game page by page
+    async def iter_maps(self, game : Game) -> AsyncIterator[Map]:
+        async for page in self._iter_pages("map", {"game":game.value}):
+            for m in page:
+                yield Map.from_dict(m)
+
+    @with_priority
     async def load_maps(self):
-        first_bhop = self.get_strafes("map", {
-            "game":Game.BHOP.value,
-            "page":1
-        })
-        first_surf = self.get_strafes("map", {
-            "game":Game.SURF.value,
-            "page":1
-        })
-        tasks = [first_bhop, first_surf]
-        data : List[JSONRes] = await asyncio.gather(*tasks)
-        bhop_maps = data[0].json
-        surf_maps = data[1].json
-        bhop_pages = int(data[0].res.headers["Pagination-Count"])
-        surf_pages = int(data[1].res.headers["Pagination-Count"])
-
-        tasks = []
-        page = Incrementer(1)
-        while page.increment() < bhop_pages:
-            tasks.append(self._map_mapper(Game.BHOP, page.get()))
-        page = Incrementer(1)
-        while page.increment() < surf_pages:
-            tasks.append(self._map_mapper(Game.SURF, page.get()))
-        responses : List[Tuple[Game, JSONRes]] = await asyncio.gather(*tasks)
-        for game, res in responses:
-            if game == Game.BHOP:
-                bhop_maps += res.json
-            elif game == Game.SURF:
-                surf_maps += res.json
-        
-        async with self._map_lock.writer_lock:
-            self._bhop_map_count = len(bhop_maps)
-            self._surf_map_count = len(surf_maps)
-
-            self._bhop_map_pairs.clear()
-            self._surf_map_pairs.clear()
-            self._map_lookup.clear()
+        async def collect(game : Game) -> List[Map]:
+            return [map async for map in self.iter_maps(game)]
+        bhop_maps, surf_maps = await asyncio.gather(collect(Game.BHOP), collect(Game.SURF))
+        await self._set_maps(bhop_maps, surf_maps)
 
-            for m in bhop_maps:
-                map = Map.from_dict(m)
-                self._bhop_map_pairs.append((map.displayname.lower(), map))
-                self._map_lookup[map.id] = map
-            self._bhop_map_pairs.sort(key=lambda i: i[0])
-
-            for m in surf_maps:
-                map = Map.from_dict(m)
-                self._surf_map_pairs.append((map.displayname.lower(), map))
-                self._map_lookup[map.id] = map
-            self._surf_map_pairs.sort(key=lambda i: i[0])
-            self._maps_loaded = True
-
-    # ls should be sorted
-    # performs an iterative binary search
-    # returns the first index where the item was found according to the compare function
+    # the parts of a map that can change after it was uploaded
     @staticmethod
-    def _find_item(ls, compare) -> int:
-        left = 0
-        right = len(ls) - 1
-        while left <= right:
-            middle = (left + right) // 2
-            res = compare(ls[middle])
-            if res == 0:
-                return middle
-            elif res < 0:
-                left = middle + 1
+    def _map_changed(old : Map, new : Map) -> bool:
+        return (old.displayname != new.displayname or old.creator != new.creator or
+            old.date.timestamp != new.date.timestamp or old.thumbnail != new.thumbnail)
+
+    # returns the maps of a game that are new or changed compared to known
+    # maps are listed oldest first, so after the first page this walks back from the last page and stops at
+    # the first page with nothing new on it
+    # returns None if the catalog can't be patched (a map was removed or a new one was missed) and needs a full load
+    async def _fetch_map_changes(self, game : Game, known : Dict[int, Map]) -> Optional[List[Map]]:
+        first_page_res = await self.get_strafes("map", {"game":game.value, "page":1})
+        if len(first_page_res.json) == 0:
+            return [] if not known else None
+        page_size = len(first_page_res.json)
+        page_count = int(first_page_res.res.headers["Pagination-Count"])
+        total = None
+        new_count = 0
+        changes : List[Map] = []
+        for page in itertools.chain((1,), range(page_count, 1, -1)):
+            if page == 1:
+                data = first_page_res.json
             else:
-                right = middle - 1
-        return -1
-
-    @staticmethod
-    def _compare_maps(name : str, map_name : str) -> int:
-        if map_name.startswith(name):
-            return 0
-        elif map_name < name:
-            return -1
-        else:
-            return 1
+                data = (await self.get_strafes("map", {"game":game.value, "page":page})).json
+            if page == page_count:
+                total = (page_count - 1) * page_size + len(data)
+            page_changed = False
+            for m in data:
+                map = Map.from_dict(m)
+                old = known.get(map.id)
+                if old is None:
+                    new_count += 1
+                elif not self._map_changed(old, map):
+                    continue
+                changes.append(map)
+                page_changed = True
+            if page != 1 and not page_changed:
+                break
+        if total is None:
+            total = len(first_page_res.json)
+        if len(known) + new_count != total:
+            return None
+        return changes
+
+    # like load_maps, but only fetches the pages with new or changed maps
+    @with_priority
+    async def refresh_maps(self):
+        if self._catalog is None:
+            await self.load_maps()
+            return
+        known = dict(self._catalog.lookup)
+        bhop_changes, surf_changes = await asyncio.gather(
+            self._fetch_map_changes(Game.BHOP, {id: map for id, map in known.items() if map.game == Game.BHOP}),
+            self._fetch_map_changes(Game.SURF, {id: map for id, map in known.items() if map.game == Game.SURF})
+        )
+        if bhop_changes is None or surf_changes is None:
+            await self.load_maps()
+            return
+        if not bhop_changes and not surf_changes:
+            return
+        for map in itertools.chain(bhop_changes, surf_changes):
+            known[map.id] = map
+        await self._set_maps(
+            [map for map in known.values() if map.game == Game.BHOP],
+            [map for map in known.values() if map.game == Game.SURF]
+        )
+
+    async def _set_maps(self, bhop_maps : List[Map], surf_maps : List[Map]):
+        # build the new catalog off the event loop, readers keep using the old one until it's swapped in
+        catalog = await asyncio.to_thread(MapCatalog, bhop_maps, surf_maps)
+        self._catalog = catalog
+        if self._catalog_path:
+            try:
+                await asyncio.to_thread(save_catalog, self._catalog_path, catalog)
+            except OSError:
+                # the saved catalog only speeds up the next start, it's fine if it can't be written
+                pass
+
+    # loads the catalog saved by the last load, so maps work right away on startup
+    # reading and decompressing the file and rebuilding the catalog is done in a thread to keep the event loop free
+    # the saved maps may be out of date so this should be followed by refresh_maps
+    async def load_saved_maps(self) -> bool:
+        if not self._catalog_path:
+            return False
+        catalog = await asyncio.to_thread(load_catalog, self._catalog_path)
+        if catalog is None:
+            return False
+        self._catalog = catalog
+        return True
 
-    @staticmethod
-    def _map_from_name(name : str, ls : List[Tuple[str, Map]]) -> Optional[Map]:
-        name = name.lower()
-        idx = StrafesClient._find_item(ls, lambda m : StrafesClient._compare_maps(name, m[0]))
-        if idx != -1:
-            while idx > 0:
-                if ls[idx-1][0].startswith(name):
-                    idx -= 1
-                else:
-                    break
-            return ls[idx][1]
-        else:
-            the_map = None
-            shortest_name = None
-            for map_name, m in ls:
-                if name in map_name and (shortest_name is None or len(map_name) < len(shortest_name)):
-                    shortest_name = map_name
-                    the_map = m
-            return the_map
+    def _get_catalog(self) -> MapCatalog:
+        catalog = self._catalog
+        if catalog is None:
+            raise MapsNotLoadedError()
+        return catalog
 
     async def map_from_name(self, map_name : str, game : Optional[Game]) -> Optional[Map]:
-        async with self._map_lock.reader_lock:
-            if not self._maps_loaded:
-                raise MapsNotLoadedError()
-            if game == Game.BHOP:
-                return self._map_from_name(map_name, self._bhop_map_pairs)
-            elif game == Game.SURF:
-                return self._map_from_name(map_name, self._surf_map_pairs)
-            elif game is None:
-                res = self._map_from_name(map_name, self._bhop_map_pairs)
-                if res is None:
-                    res = self._map_from_name(map_name, self._surf_map_pairs)
-                return res
-            return None
+        return self._get_catalog().map_from_name(map_name, game)
+
+    # maps with names similar to map_name (for typos), closest first
+    async def suggest_maps(self, map_name : str, game : Optional[Game], limit : int = 3) -> List[Map]:
+        return self._get_catalog().suggest(map_name, game, limit)
 
     async def map_from_id(self, map_id:int) -> Map:
-        async with self._map_lock.reader_lock:
-            if not self._maps_loaded:
-                raise MapsNotLoadedError()
-            try:
-                return self._map_lookup[map_id]
-            except KeyError:
-                return Map(-1, "Missing map", "", Game.BHOP, -1, -1)
+        try:
+            return self._get_catalog().lookup[map_id]
+        except KeyError:
+            return Map(-1, "Missing map", "", Game.BHOP, -1, -1, None)
 
     async def get_map_count(self, game : Game) -> int:
-        async with self._map_lock.reader_lock:
-            if not self._maps_loaded:
-                raise MapsNotLoadedError()
-            if game == Game.BHOP:
-                return self._bhop_map_count
-            elif game == Game.SURF:
-                return self._surf_map_count
-            else:
-                return 1
+        return self._get_catalog().count(game)
 
+    # sorted by game then displayname
     async def get_maps_by_creator(self, creator : Optional[str]) -> List[Map]:
-        async with self._map_lock.reader_lock:
-            if not self._maps_loaded:
-                raise MapsNotLoadedError()
-            if not creator:
-                return list(self._map_lookup.values())
-            creator = creator.lower()
-            matches = []
-            for map in self._map_lookup.values():
-                if creator in map.creator.lower():
-                    matches.append(map)
-            return matches
+        return self._get_catalog().creator_index.search(creator)
 
     async def get_all_maps(self) -> List[Map]:
-         async with self._map_lock.reader_lock:
-            if not self._maps_loaded:
-                raise MapsNotLoadedError()
-            return list(self._map_lookup.values())
+        return list(self._get_catalog().lookup.values())
 
+    @with_priority
     async def get_user_data_no_cache(self, user : Union[str, int]) -> User:
         if type(user) == int:
             res = await self.get_request(f"https://users.roblox.com/v1/users/{user}", "Roblox Users")
@@ -385,58 +547,110 @@ class StrafesClient:
             else:
                 raise NotFoundError
 
+    @with_priority
     @cached(ttl=60*60)
     async def get_user_data(self, user : Union[str, int]) -> User:
         return await self.get_user_data_no_cache(user)
 
+    @with_priority
     async def get_user_data_from_list(self, users : List[int]) -> Dict[int, User]:
         res = await self.post_request("https://users.roblox.com/v1/users", "Roblox Users", {"userIds":users})
         user_lookup = {}
         for user_dict in res.json["data"]:
-            user = User.from_dict(user_dict)
+            user = self._intern_user(User.from_dict(user_dict))
             user_lookup[user.id] = user
         return user_lookup
 
+    # returns the shared User with user's id, filling in anything user knows that it doesn't
+    # (or user itself if there isn't one yet)
+    def _intern_user(self, user : User) -> User:
+        existing = self._users.get(user.id)
+        if existing is None:
+            self._users[user.id] = user
+            return user
+        if existing is not user:
+            existing.username = user.username
+            if user.displayname is not None:
+                existing.displayname = user.displayname
+            if user.description is not None:
+                existing.description = user.description
+            if user.thumbnail is not None:
+                existing.thumbnail = user.thumbnail
+        return existing
+
+    # returns the catalog's Map with map_dict's id if it's loaded, otherwise the shared (partial) Map for that id
+    # catalog maps come from the v1 map list which usually has no thumbnail, so if thumbnail is given and the
+    # catalog's is different a copy of the catalog's Map with thumbnail is returned instead (the catalog is never modified)
+    def _intern_map(self, map_dict : Dict[str, Any], thumbnail : Optional[str] = None) -> Map:
+        map_id = map_dict["id"]
+        catalog = self._catalog
+        if catalog is not None:
+            map = catalog.lookup.get(map_id)
+            if map is not None:
+                if thumbnail is not None and map.thumbnail != thumbnail:
+                    map = Map(map.id, map.displayname, map.creator, map.game, map.date, map.playcount, thumbnail)
+                return map
+        map = self._maps.get(map_id)
+        if map is None:
+            map = Map(map_id, map_dict["display_name"].replace(u'\u200a', ' '), "", Game(map_dict["game_id"]), Date(0), 0, thumbnail)
+            self._maps[map_id] = map
+        elif thumbnail is not None and map.thumbnail is None:
+            map.thumbnail = thumbnail
+        return map
+
+    # decodes a list of times from the strafes api in one pass
+    # user and map are used for every record if given, otherwise users come from users (by each time's "User" id) or each time's "user",
+    # and maps come from the catalog (if it's loaded) or each time's "map"
+    # users and maps are interned, so records share one User/Map per id (see _intern_user and _intern_map)
+    # strafes_globals is for times from the fiveman1 strafes api, which has the mode in "course" and thumbnails
+    # the rest of each time is read by Record.from_dict (or Record.from_dict_strafes_globals)
+    def records_from_dicts(self, records : List[Dict[str, Any]], user : Optional[User] = None, map : Optional[Map] = None, 
+            users : Optional[Dict[int, User]] = None, strafes_globals : bool = False) -> List[Record]:
+        # the interned objects of this call, so repeated ids skip the weak dictionaries
+        user_cache : Dict[int, User] = {}
+        map_cache : Dict[int, Map] = {}
+        from_dict = Record.from_dict_strafes_globals if strafes_globals else Record.from_dict
+        ls = []
+        for d in records:
+            record_user = user
+            if record_user is None:
+                # records from the v1 api only have the user's id (as "User"), which is looked up in users
+                # while globals and v2 records have the user inline
+                user_id = d["User"] if users is not None else d["user"]["id"]
+                record_user = user_cache.get(user_id)
+                if record_user is None:
+                    if users is not None:
+                        record_user = users[user_id]
+                    else:
+                        user_dict = d["user"]
+                        record_user = User(user_id, user_dict["username"])
+                        if strafes_globals:
+                            record_user.thumbnail = user_dict["thumbnail"]
+                    record_user = user_cache[user_id] = self._intern_user(record_user)
+            record_map = map
+            if record_map is None:
+                map_dict = d["map"]
+                record_map = map_cache.get(map_dict["id"])
+                if record_map is None:
+                    record_map = map_cache[map_dict["id"]] = self._intern_map(map_dict, map_dict.get("thumbnail") if strafes_globals else None)
+            ls.append(from_dict(d, record_user, record_map))
+        return ls
+
     #include user or map if they are known already
     async def record_from_dict(self, d : Dict, user : User = None, map : Map = None) -> Record:
-        if not user:
-            user_dict = d["user"]
-            user = User(user_dict["id"], user_dict["username"])
-            # user = await self.get_user_data(d["User"])
-        if not map:
-            map_dict : Dict = d["map"]
-            map = Map(map_dict["id"], map_dict["display_name"].replace(u'\u200a', ' '), "", Game(map_dict["game_id"]), Date(0), 0, None)
-            # map = await self.map_from_id(d["Map"])
-        return Record.from_dict(d, user, map)
+        return self.records_from_dicts([d], user=user, map=map)[0]
     
     async def record_from_strafes_globals(self, d : Dict, user : User = None, map : Map = None) -> Record:
-        if not user:
-            user_dict = d["user"]
-            user = User(user_dict["id"], user_dict["username"])
-            user.thumbnail = user_dict["thumbnail"]
-            # user = await self.get_user_data(d["User"])
-        if not map:
-            map_dict : Dict = d["map"]
-            map = Map(map_dict["id"], map_dict["display_name"].replace(u'\u200a', ' '), "", Game(map_dict["game_id"]), Date(0), 0, map_dict.get("thumbnail"))
-            # map = await self.map_from_id(d["Map"])
-        return Record.from_dict_strafes_globals(d, user, map)
+        return self.records_from_dicts([d], user=user, map=map, strafes_globals=True)[0]
 
     #include user or map if they are known already
     async def make_record_list(self, records : List, user : User = None, map : Map = None) -> List[Record]:
-        ls = []
         id_to_user = None
-        if not user:
-            user_ids = set()
-            for record in records:
-                user_ids.add(record["User"])
-            id_to_user = await self.get_user_data_from_list(list(user_ids))
-        for record in records:
-            if not user:
-                ls.append(await self.record_from_dict(record, user=id_to_user[record["User"]], map=map))
-            else:
-                ls.append(await self.record_from_dict(record, user=user, map=map))
-        return ls
+        if not user and records:
+            id_to_user = await self.get_user_data_from_list(list({record["User"] for record in records}))
+        return self.records_from_dicts(records, user=user, map=map, users=id_to_user)
 
+    @with_priority
     async def get_recent_wrs(self, game:Game, style:Style) -> List[Record]:
         res = await self.get_strafes("time/recent/wr", {
             "game":game.value,
@@ -445,6 +659,7 @@ class StrafesClient:
         })
         return await self.make_record_list(res.json)
 
+    @with_priority
     async def get_user_wrs(self, user_data:User, game:Game, style:Style) -> List[Record]:
         res = await self.get_strafes(f"time/user/{user_data.id}/wr", {
             "game":game.value,
@@ -456,6 +671,7 @@ class StrafesClient:
             return []
 
     #returns a record object of a user's time on a given map
+    @with_priority
     async def get_user_record(self, user_data:User, game:Game, style:Style, map:Map) -> Optional[Record]:
         res = await self.get_strafes(f"time/user/{user_data.id}", {
             "game":game.value,
@@ -467,6 +683,7 @@ class StrafesClient:
         else:
             return await self.record_from_dict(res.json[0], user=user_data)
 
+    @with_priority
     async def total_wrs(self, user_data:User, game:Game, style:Style) -> int:
         res = await self.get_strafes(f"time/user/{user_data.id}/wr", {
             "game":game.value,
@@ -477,6 +694,7 @@ class StrafesClient:
         else:
             return 0
 
+    @with_priority
     async def get_user_rank(self, user_data:User, game:Game, style:Style) -> Optional[Rank]:
         res = await self.get_strafes(f"rank/{user_data.id}", {
             "game":game.value,
@@ -487,43 +705,66 @@ class StrafesClient:
         else:
             return None
 
-    async def find_max_pages(self, url, params, page_count, page_length, custom_page_length) -> int:
-        params["page"] = page_count
+    # fetches a page of a paginated strafes.net endpoint along with the number of pages and the length of the last page
+    # if the page is past the end the last page is returned instead
+    # returns (page data, page number of the data, page count, last page length) or None if there are no results
+    async def _get_page_with_info(self, url : str, params : Dict[str, Any], page : int) -> Optional[Tuple[List[Dict[str, Any]], int, int, int]]:
+        params = params.copy()
+        info = self._page_info.get(url, params)
+        if info is not None:
+            page_count, last_page_length = info
+            page = min(page, page_count)
+            params["page"] = page
+            res = await self.get_strafes(url, params)
+            if len(res.json) > 0:
+                if page == page_count:
+                    self._page_info.set(url, params, page_count, len(res.json))
+                return res.json, page, page_count, len(res.json) if page == page_count else last_page_length
+            # the cached page count is stale
+            self._page_info.invalidate(url, params)
+        params["page"] = page
         res = await self.get_strafes(url, params)
         data = res.json
-        if len(data) > 0:
-            converted_page_count = int(((page_count - 1) * (page_length / custom_page_length)) + ((len(data) - 1) // custom_page_length) + 1)
-            return converted_page_count
+        if len(data) == 0:
+            if page == 1:
+                return None
+            params["page"] = 1
+            res = await self.get_strafes(url, params)
+            if len(res.json) == 0:
+                return None
+        page_count = int(res.res.headers["Pagination-Count"])
+        if len(data) > 0 and page == page_count:
+            last_page_data = data
         else:
-            return 0
+            params["page"] = page_count
+            last_page_data = (await self.get_strafes(url, params)).json
+            if len(data) == 0:
+                data = last_page_data
+                page = page_count
+        self._page_info.set(url, params, page_count, len(last_page_data))
+        return data, page, page_count, len(last_page_data)
+
+    # forget cached page counts that a new time could have changed
+    def _invalidate_page_info(self, record : Record):
+        self._page_info.invalidate_matching(lambda url, params: 
+            url == f"time/map/{record.map.id}" or 
+            url == f"time/user/{record.user.id}" or 
+            (url == "rank" and params.get("game") == record.game.value and params.get("style") == record.style.value))
 
     #returns 25 ranks at a given page number, page 1: top 25, page 2: 26-50, etc.
+    @with_priority
     async def get_ranks(self, game:Game, style:Style, page:int) -> Tuple[List[Rank], int]:
         params = {
             "game":game.value,
-            "style":style.value,
-            "page":(int((page - 1) / 2)) + 1
+            "style":style.value
         }
         page_length = 25
-        res = await self.get_strafes("rank", params)
-        data = res.json
-        if len(data) > 0:
-            page_count = int(res.res.headers["Pagination-Count"])
-            converted_page_count = await self.find_max_pages("rank", params, page_count, 50, page_length)
-        else:
-            params["page"] = 1
-            first_page_res = await self.get_strafes("rank", params)
-            if len(first_page_res.json) == 0:
-                return [], 0
-            else:
-                page_count = int(first_page_res.res.headers["Pagination-Count"])
-                params["page"] = page_count
-                tasks = [self.find_max_pages("rank", params, page_count, 50, page_length), self.get_strafes("rank", params)]
-                results = await asyncio.gather(*tasks)
-                converted_page_count = results[0]
-                the_res = results[1]
-                data = the_res.json
-                page = converted_page_count
+        result = await self._get_page_with_info("rank", params, (int((page - 1) / 2)) + 1)
+        if result is None:
+            return [], 0
+        data, _, page_count, last_page_length = result
+        converted_page_count = self.converted_page_count(last_page_length, page_count, 50, page_length)
+        page = min(page, converted_page_count)
         if page % 2 == 1:
             data = data[:25]
         else:
@@ -534,82 +775,80 @@ class StrafesClient:
             ls.append(Rank.from_dict(i, user_lookup[i["User"]]))
         return ls, converted_page_count
 
+    @staticmethod
+    def converted_page_count(last_page_length, page_count, real_page_length, custom_page_length) -> int:
+        return int(((page_count - 1) * (real_page_length / custom_page_length)) + ((last_page_length - 1) // custom_page_length) + 1)
+
     @staticmethod
     def find_max_page(last_page, page_count, real_page_length, custom_page_length) -> int:
-        return int(((page_count - 1) * (real_page_length / custom_page_length)) + ((len(last_page) - 1) // custom_page_length) + 1)
+        return StrafesClient.converted_page_count(len(last_page), page_count, real_page_length, custom_page_length)
 
-    async def get_user_times(self, user_data:User, game:Optional[Game], style:Optional[Style], page:int) -> Tuple[List[Record], int]:
-        url = f"time/user/{user_data.id}"
-        params = {"page":1}
+    @staticmethod
+    def _user_times_params(game : Optional[Game], style : Optional[Style]) -> Dict[str, Any]:
+        params = {}
         if game is not None:
             params["game"] = game.value
         if style is not None:
             params["style"] = style.value
-        first_page_res = await self.get_strafes(url, params)
-        first_page_data = first_page_res.json
-        if len(first_page_data) == 0:
-            return [], 0
-        pagination_count = int(first_page_res.res.headers["Pagination-Count"])
+        return params
+
+    # yields every time a user has in the given game and style (None for all) page by page, newest first
+    async def iter_user_times(self, user_data:User, game:Optional[Game], style:Optional[Style]) -> AsyncIterator[Record]:
+        async for page in self._iter_pages(f"time/user/{user_data.id}", self._user_times_params(game, style)):
+            for record in await self.make_record_list(page, user=user_data):
+                yield record
+
+    # yields every time on a map in the given style page by page, in the order strafes.net returns them
+    # (which is only roughly sorted across page boundaries, see get_map_times)
+    async def iter_map_times(self, style:Style, map:Map) -> AsyncIterator[Record]:
+        async for page in self._iter_pages(f"time/map/{map.id}", {"style":style.value}):
+            for record in await self.make_record_list(page, map=map):
+                yield record
+
+    @with_priority
+    async def get_user_times(self, user_data:User, game:Optional[Game], style:Optional[Style], page:int) -> Tuple[List[Record], int]:
         if page == -1:
-            tasks = []
-            the_page = Incrementer(1)
-            while the_page.increment() < pagination_count:
-                params_copy = params.copy()
-                params_copy["page"] = the_page.get()
-                tasks.append(self.get_strafes(url, params_copy))
-            responses = await asyncio.gather(*tasks)
-            results = first_page_data
-            for response in responses:
-                results += response.json
-            return await self.make_record_list(results, user=user_data), -1
-        else:
-            page_length = 25
-            the_real_page, start = divmod((int(page) - 1) * page_length, 200)
-            the_real_page += 1
+            records = [record async for record in self.iter_user_times(user_data, game, style)]
+            return records, -1 if records else 0
+        page_length = 25
+        the_real_page, start = divmod((int(page) - 1) * page_length, 200)
+        the_real_page += 1
+        end = start + page_length
+        result = await self._get_page_with_info(f"time/user/{user_data.id}", self._user_times_params(game, style), the_real_page)
+        if result is None:
+            return [], 0
+        the_page_data, _, pagination_count, last_page_length = result
+        max_page = self.converted_page_count(last_page_length, pagination_count, 200, page_length)
+        if page > max_page:
+            start = ((int(max_page) - 1) * page_length) % 200
             end = start + page_length
-            the_page_data = None
-            last_page_data = None
-            if pagination_count == 1:
-                the_page_data = first_page_data
-                last_page_data = first_page_data
-            elif the_real_page == 1:
-                the_page_data = first_page_data
-                params["page"] = pagination_count
-                the_res = await self.get_strafes(url, params)
-                last_page_data = the_res.json
-            elif the_real_page >= pagination_count:
-                params["page"] = pagination_count
-                the_res = await self.get_strafes(url, params)
-                last_page_data = the_res.json
-                the_page_data = last_page_data
-            else:
-                tasks = []
-                params_copy = params.copy()
-                params_copy["page"] = the_real_page
-                tasks.append(self.get_strafes(url, params_copy))
-                params_copy = params.copy()
-                params_copy["page"] = pagination_count
-                tasks.append(self.get_strafes(url, params_copy))
-                responses = await asyncio.gather(*tasks)
-                the_page_data = responses[0].json
-                last_page_data = responses[1].json
-            max_page = self.find_max_page(last_page_data, pagination_count, 200, page_length)
-            if page > max_page:
-                start = ((int(max_page) - 1) * page_length) % 200
-                end = start + page_length
-            return await self.make_record_list(the_page_data[start:end], user=user_data), max_page
-
+        return await self.make_record_list(the_page_data[start:end], user=user_data), max_page
+
+    # every time a user has in the given game and style (None for all) as a RecordBatch, for sorting or grouping
+    # large time lists without building a Record for each one
+    @with_priority
+    async def get_user_time_batch(self, user_data:User, game:Optional[Game], style:Optional[Style]) -> RecordBatch:
+        records = []
+        async for page in self._iter_pages(f"time/user/{user_data.id}", self._user_times_params(game, style)):
+            records.extend(page)
+        return RecordBatch.from_dicts(records, user_data)
+
+    @with_priority
     async def get_user_completion(self, user_data:User, game:Game, style:Style) -> Tuple[int, int]:
-        records, _ = await self.get_user_times(user_data, game, style, -1)
-        return len(records), await self.get_map_count(game)
+        batch = await self.get_user_time_batch(user_data, game, style)
+        return len(batch), await self.get_map_count(game)
 
     #records is a list of records from a given map
     @staticmethod
     def sort_map(records:List[Dict[str, Any]]):
-        records.sort(key=lambda i: (i["time"], utc2local(i["date"])))
+        # parse every date once up front instead of inside the sort key
+        dates = utc2local_batch([record["date"] for record in records])
+        order = sorted(range(len(records)), key=lambda i: (records[i]["time"], dates[i]))
+        records[:] = [records[i] for i in order]
 
     #changes a WR's diff and previous_record in place by comparing first and second place
     #times on the given map
+    @with_priority
     async def calculate_wr_diff(self, record : Record) -> bool:
         if record.previous_record is not None:
             return True
@@ -618,7 +857,7 @@ class StrafesClient:
             "mode_id": 0,
             "style_id": record.style.value,
         })
-        data = res.json["data"]
+        data = list(res.json["data"])
         if len(data) > 1:
             self.sort_map(data)
             if data[0]["id"] != record.id:
@@ -628,6 +867,7 @@ class StrafesClient:
         return True
 
     # returns a list of lists of wrs, each list is a unique game/style combination
+    @with_priority
     async def get_wrs(self) -> List[Dict]:
         # tasks = []
         # for game in DEFAULT_GAMES:
@@ -650,50 +890,65 @@ class StrafesClient:
         # filter out fly trials
         return list(filter(lambda wr : wr["game_id"] == Game.BHOP.value or wr["game_id"] == Game.SURF.value, wrs))
 
-    async def write_wrs(self):
-        with open(fix_path("files/recent_wrs.json"), "w") as file:
-            wrs = await self.get_wrs()
-            json.dump(wrs, file)
+    RECENT_WRS_PATH = "files/recent_wrs.json"
 
-    @staticmethod
-    def search(ls, record):
-        for i in ls:
-            if record["id"] == i["id"]:
-                return i
-        return None
+    async def _set_recent_wrs(self, wrs : List[Dict[str, Any]]):
+        self._recent_wrs = WRSet(wrs)
+        await asyncio.to_thread(write_json, self.RECENT_WRS_PATH, wrs)
+
+    # the wrs from last time, read from disk only if they aren't in memory yet (e.g. after a restart)
+    async def _get_recent_wrs(self) -> Optional[WRSet]:
+        if self._recent_wrs is None:
+            try:
+                self._recent_wrs = WRSet(await asyncio.to_thread(open_json, self.RECENT_WRS_PATH))
+            except (FileNotFoundError, ValueError):
+                return None
+        return self._recent_wrs
 
+    @with_priority
+    async def write_wrs(self):
+        await self._set_recent_wrs(await self.get_wrs())
+
+    @with_priority
     async def get_new_wrs(self) -> List[Record]:
-        try:
-            old_wrs = open_json("files/recent_wrs.json")
-        except FileNotFoundError:
+        old_wrs = await self._get_recent_wrs()
+        if old_wrs is None:
             await self.write_wrs()
             return []
         new_wrs = await self.get_wrs()
-        globals:List[Record] = []
+        #pairs of (new wr, the old wr it replaced or None)
+        changed : List[Tuple[Dict, Optional[Dict]]] = []
         two_hours_ago = (datetime.datetime.now() - datetime.timedelta(hours=2)).timestamp()
         for record in new_wrs:
             if utc2local(record["date"]) < two_hours_ago:
                 break
-            match = self.search(old_wrs, record)
-            if match:
-                #records by the same person on the same map have the same id even if they beat it
-                if record["time"] != match["time"]:
-                    r = await self.record_from_strafes_globals(record)
-                    r.diff = round((int(record["time"]) - int(match["time"])) / 1000.0, 3)
-                    r.previous_record = await self.record_from_strafes_globals(match)
-                    globals.append(r)
-            else:
-                globals.append(await self.record_from_strafes_globals(record))
+            match = old_wrs.previous(record)
+            if match is None:
+                changed.append((record, None))
+            elif int(record["time"]) < int(match["time"]):
+                changed.append((record, match))
+            elif match["id"] != record["id"]:
+                # a different record with the same (or a slower) time than the old wr, let calculate_wr_diff check it
+                changed.append((record, None))
+        globals = self.records_from_dicts([record for record, _ in changed], strafes_globals=True)
+        previous = iter(self.records_from_dicts([match for _, match in changed if match is not None], strafes_globals=True))
+        for r, (record, match) in zip(globals, changed):
+            if match is not None:
+                r.diff = round((int(record["time"]) - int(match["time"])) / 1000.0, 3)
+                r.previous_record = next(previous)
+
+        #new times change the page counts of the map, user and leaderboard they were set on
+        for wr in globals:
+            self._invalidate_page_info(wr)
 
         #overwrite recent_wrs.json with new wrs if they exist
         if len(globals) > 0:
-            with open(fix_path("files/recent_wrs.json"), "w") as file:
-                json.dump(new_wrs, file)
+            await self._set_recent_wrs(new_wrs)
 
         tasks = []
         for wr in globals:
-            tasks.append(self.calculate_wr_diff(wr))
-        rets = await asyncio.gather(*tasks)
+            tasks.append(functools.partial(self.calculate_wr_diff, wr))
+        rets = await bounded_gather(tasks, self._max_concurrency)
 
         checked_globals:List[Record] = []
         
@@ -704,39 +959,24 @@ class StrafesClient:
         checked_globals.sort(key = lambda i: i.date.timestamp)
         return checked_globals
 
+    @with_priority
     async def get_map_times(self, style:Style, map:Map, page:int) -> Tuple[List[Record], int]:
         page_length = 25
         page_num, start = divmod((int(page) - 1) * page_length, 200)
         page_num += 1
         params = {
-            "style":style.value,
-            "page":page_num
+            "style":style.value
         }
-        res = await self.get_strafes(f"time/map/{map.id}", params)
-        data = res.json
-        if len(data) > 0:
-            page_count = int(res.res.headers["Pagination-Count"])
-            params["page"] = page_count
-            converted_page_count = await self.find_max_pages(f"time/map/{map.id}", params, page_count, 200, page_length)
-        else:
-            params["page"] = 1
-            first_page_res = await self.get_strafes(f"time/map/{map.id}", params)
-            if len(first_page_res.json) == 0:
-                return [], 0
-            else:
-                page_count = int(first_page_res.res.headers["Pagination-Count"])
-                params["page"] = page_count
-                tasks = [self.find_max_pages(f"time/map/{map.id}", params, page_count, 200, page_length), self.get_strafes(f"time/map/{map.id}", params)]
-                results = await asyncio.gather(*tasks)
-                converted_page_count = results[0]
-                page_num = converted_page_count
-                the_res = results[1]
-                data = the_res.json
+        result = await self._get_page_with_info(f"time/map/{map.id}", params, page_num)
+        if result is None:
+            return [], 0
+        data, page_num, page_count, last_page_length = result
+        converted_page_count = self.converted_page_count(last_page_length, page_count, 200, page_length)
 
         #add the previous and next page so that we can sort the times across pages properly
         before_len = 0
         add_before = page_num > 1
-        add_after = page_num + 1 <= converted_page_count
+        add_after = page_num + 1 <= page_count
         tasks = []
 
         if add_before:
@@ -754,8 +994,9 @@ class StrafesClient:
                 before_len = len(results[0].json)
                 data = results[0].json + data
             if add_after:
-                data += results[-1].json
+                data = data + results[-1].json
 
+        data = list(data)
         self.sort_map(data)
         if page > converted_page_count:
             start = ((int(converted_page_count) - 1) * page_length) % 200
@@ -763,6 +1004,7 @@ class StrafesClient:
         end = start + page_length
         return await self.make_record_list(data[start:end], map=map), converted_page_count
 
+    @with_priority
     async def get_user_state(self, user_data:User) -> Optional[UserState]:
         try:
             res = await self.get_strafes(f"user/{user_data.id}", {})
@@ -770,25 +1012,24 @@ class StrafesClient:
         except NotFoundError:
             return None
 
+    @with_priority
     async def get_record_placement(self, record:Record) -> Tuple[int, int]:
+        url = f"time/map/{record.map.id}"
         params = {
-            "style":record.style.value,
-            "page":1
+            "style":record.style.value
         }
-        first_page_res = await self.get_strafes(f"time/map/{record.map.id}", params)
-        page_count = int(first_page_res.res.headers["Pagination-Count"])
-        completions = 0
-        tasks = [self.get_strafes(f"time/{record.id}/rank", {})]
-        if page_count == 1:
-            completions = len(first_page_res.json)
-            res = await asyncio.gather(*tasks)
-            rank = res[0].json["Rank"]
-        else:
-            params["page"] = page_count
-            tasks.append(self.get_strafes(f"time/map/{record.map.id}", params))
-            res = await asyncio.gather(*tasks)
-            rank = res[0].json["Rank"]
-            completions = len(res[1].json) + (page_count - 1) * 200
+        rank_task = asyncio.ensure_future(self.get_strafes(f"time/{record.id}/rank", {}))
+        try:
+            info = self._page_info.get(url, params)
+            if info is None:
+                result = await self._get_page_with_info(url, params, 1)
+                info = (0, 0) if result is None else result[2:]
+        except:
+            rank_task.cancel()
+            raise
+        page_count, last_page_length = info
+        rank = (await rank_task).json["Rank"]
+        completions = last_page_length + (page_count - 1) * 200 if page_count > 0 else 0
         return rank, completions
 
     async def verify_response_handler(self, res : aiohttp.ClientResponse, url : str, api_name : str, params={}, headers={}) -> VerifyRes:
@@ -813,14 +1054,17 @@ class StrafesClient:
             verify_res = await VerifyRes.from_response(res)
         return verify_res
 
+    @with_priority
     async def begin_verify_user(self, discord_id : int, roblox_user : User) -> VerifyRes:
         return await self.get_request(f"https://api.fiveman1.net/v1/verify/users/{discord_id}", "Verification", params = {"robloxId": roblox_user.id}, 
             headers=self._verify_headers, callback=self.verify_response_handler)
 
+    @with_priority
     async def try_verify_user(self, discord_id : int) -> VerifyRes:
         return await self.post_request(f"https://api.fiveman1.net/v1/verify/users/{discord_id}", "Verification", 
             headers=self._verify_headers, callback=self.verify_response_handler)
 
+    @with_priority
     async def remove_discord_to_roblox(self, discord_id : int) -> Optional[User]:
         res = await self.delete_request(f"https://api.fiveman1.net/v1/verify/users/{discord_id}", "Verification", 
             headers=self._verify_headers, callback=self.verify_response_handler)
@@ -830,6 +1074,7 @@ class StrafesClient:
         else:
             return None
 
+    @with_priority
     async def get_roblox_from_discord_non_cached(self, discord_id : int) -> Optional[int]:
         res = await self.get_request(f"https://api.fiveman1.net/v1/users/{discord_id}", "Verification", callback=self.verify_response_handler)
         if res:
@@ -839,6 +1084,7 @@ class StrafesClient:
         else:
             return None
 
+    @with_priority
     async def get_roblox_user_from_discord(self, discord_id : int) -> Optional[int]:
         user = await self._discord_user_cache.get(discord_id)
         if user:
@@ -846,6 +1092,7 @@ class StrafesClient:
         else:
             return await self.get_roblox_from_discord_non_cached(discord_id)
 
+    @with_priority
     @cached(ttl=60*60)
     async def get_user_headshot_url(self, user_id : int) -> str:
         params = {
@@ -857,6 +1104,7 @@ class StrafesClient:
         res = await self.get_request(f"https://thumbnails.roblox.com/v1/users/avatar-headshot", "Roblox Avatar", params=params)
         return f"{res.json['data'][0]['imageUrl']}?{random.randint(0, 100000)}"
 
+    @with_priority
     @cached()
     async def get_asset_thumbnail(self, asset_id : int) -> str:
         params = {
@@ -868,6 +1116,7 @@ class StrafesClient:
         res = await self.get_request(f"https://thumbnails.roblox.com/v1/assets", "Roblox Asset", params=params)
         return res.json["data"][0]["imageUrl"]
     
+    @with_priority
     async def get_map_thumbs(self, records: List[Record]) -> Dict[int, str]:
         asset_to_map = {}
         for record in records:
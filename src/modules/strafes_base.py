@@ -78,12 +78,19 @@ class Style(Enum):
 setattr(Style, "__new__", lambda cls, value: super(Style, cls).__new__(cls, _STR_TO_STYLE[value] if isinstance(value, str) else value))
 DEFAULT_STYLES:List[Style] = [style for style in Style if style != Style.FASTE and style != Style.LOW_GRAV]
 
+# the model classes use __slots__ since a large time list can create tens of thousands of them
+# string forms are only computed the first time they're needed
+
 class Time:
+    __slots__ = ("millis", "_time_str")
+
     def __init__(self, millis):
         self.millis : int = millis
-        self._time_str = Time.format_time(millis)
+        self._time_str : Optional[str] = None
 
     def __str__(self):
+        if self._time_str is None:
+            self._time_str = Time.format_time(self.millis)
         return self._time_str
 
     @staticmethod
@@ -107,14 +114,19 @@ class Time:
         return time
 
 class Date:
+    __slots__ = ("timestamp", "_date_str")
+
     def __init__(self, timestamp):
         self.timestamp : int = int(timestamp)
-        self._date_str = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        self._date_str : Optional[str] = None
 
     def __str__(self):
+        if self._date_str is None:
+            self._date_str = datetime.datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')
         return self._date_str
 
 class Map:
+    __slots__ = ("id", "displayname", "creator", "game", "date", "playcount", "thumbnail", "__weakref__")
 
     def __init__(self, id, displayname, creator, game, date, playcount, thumbnail):
         self.id : int = id
@@ -143,7 +155,8 @@ class Map:
             Game(d["Game"]),
             Date(utc2local(d["date"])),
             #d["playCount"]
-            0
+            0,
+            d.get("thumbnail")
         )
 
 class UserState(Enum):
@@ -160,6 +173,8 @@ class UserState(Enum):
         return self.name
 
 class User:
+    __slots__ = ("id", "username", "displayname", "description", "state", "thumbnail", "__weakref__")
+
     def __init__(self, id : int, username : str, displayname : Optional[str] = None, description: Optional[str] = None):
         self.id = id
         self.username = username
@@ -184,15 +199,16 @@ class User:
 class Rank:
     __ranks__ = ("New","Newb","Bad","Okay","Not Bad","Decent","Getting There","Advanced","Good","Great","Superb","Amazing","Sick","Master","Insane","Majestic","Baby Jesus","Jesus","Half God","God")
 
+    __slots__ = ("rank", "skill", "placement", "user")
+
     def __init__(self, rank, skill, placement, user):
         self.rank : int = rank
         self.skill : float = skill
         self.placement : int = placement
         self.user : User = user
-        self._rank_string = Rank.__ranks__[self.rank - 1]
 
     def __str__(self):
-        return self._rank_string
+        return Rank.__ranks__[self.rank - 1]
 
     @staticmethod
     def from_dict(data, user : User):
@@ -204,6 +220,8 @@ class Rank:
         )
 
 class Record:
+    __slots__ = ("id", "time", "user", "map", "date", "style", "mode", "game", "has_bot", "diff", "previous_record")
+
     def __init__(self, id, time, user, map, date, style, mode, game, has_bot):
         self.id : int = id
         self.time : Time = time
@@ -1,9 +1,12 @@
 # utils.py
+import asyncio
+import calendar
 import datetime
 import json
 import os
-import time
-from typing import List
+from typing import Awaitable, Callable, Dict, Iterable, List, TypeVar
+
+T = TypeVar("T")
 
 TRACEBACK_CHANNEL = 812768023920115742
 
@@ -15,6 +18,14 @@ def open_json(path):
         data = file.read()
         return json.loads(data)
 
+# writes next to path first and then replaces it, so readers never see a half written file
+def write_json(path, data):
+    path = fix_path(path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
 def fmt_md_code(s : str) -> str:
     s = s.replace("`", "") # don't allow the ` character to prevent escaping code blocks
     return f"```\n{s}```"
@@ -22,14 +33,35 @@ def fmt_md_code(s : str) -> str:
 def between(lo, val, hi):
     return val >= lo and val <= hi
 
-def utc2local(date: str):
+# timestamp of midnight (UTC) for each "YYYY-MM-DD" seen so far
+# records come in bunches from the same few days so this stays small, it's cleared if it ever gets big
+_day_timestamps : Dict[str, int] = {}
+
+def _utc2local_slow(date: str):
     try:
         utc = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%SZ")
     except ValueError:
         utc = datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ")
-    epoch = time.mktime(utc.timetuple())
-    offset = datetime.datetime.fromtimestamp(epoch) - datetime.datetime.utcfromtimestamp(epoch)
-    return int((utc + offset).timestamp())
+    return calendar.timegm(utc.timetuple())
+
+# converts a UTC date from the strafes api ("2023-01-02T03:04:05Z", fractions of a second are dropped)
+# to a timestamp, which can then be shown in local time
+# the common format is parsed by slicing, anything else goes through strptime
+def utc2local(date: str):
+    if len(date) < 20 or date[10] != "T" or date[-1] != "Z" or date[13] != ":" or date[16] != ":":
+        return _utc2local_slow(date)
+    day = date[:10]
+    day_timestamp = _day_timestamps.get(day)
+    if day_timestamp is None:
+        day_timestamp = calendar.timegm((int(date[:4]), int(date[5:7]), int(date[8:10]), 0, 0, 0))
+        if len(_day_timestamps) >= 4096:
+            _day_timestamps.clear()
+        _day_timestamps[day] = day_timestamp
+    return day_timestamp + int(date[11:13]) * 3600 + int(date[14:16]) * 60 + int(date[17:19])
+
+# utc2local for a whole page of dates at once
+def utc2local_batch(dates: Iterable[str]) -> List[int]:
+    return [utc2local(date) for date in dates]
 
 # increment(inc=1): returns i then increments it by inc (default i++)
 # get(): returns i
@@ -67,3 +99,24 @@ def page_messages(msg:str, max_length=1990) -> List[str]:
         s.append("\n")
     messages.append(s.build())
     return messages
+
+# awaits the coroutines made by factories with at most limit of them running at once
+# results are in the same order as factories, the first error cancels everything still running and is raised
+async def bounded_gather(factories : Iterable[Callable[[], Awaitable[T]]], limit : int) -> List[T]:
+    factories = list(factories)
+    results : List[T] = [None] * len(factories)
+    if not factories:
+        return results
+    work = iter(enumerate(factories))
+    async def worker():
+        for i, factory in work:
+            results[i] = await factory()
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(max(1, limit), len(factories)))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    return results
@@ -0,0 +1,45 @@
+import numpy as np
+
+from modules.compare import compare_styles, compare_times
+
+def arrays(*lists):
+    return [np.array(values, dtype=np.int64) for values in lists]
+
+def test_compare_times():
+    # user 0 wins map 1, user 1 wins map 2, map 3 is tied and map 4 is only done by user 1
+    map_ids = arrays([1, 2, 3], [1, 2, 3, 4])
+    times = arrays([100, 300, 500], [200, 250, 500, 700])
+    result = compare_times(map_ids, times)
+    assert result.wins[0].tolist() == [0]
+    assert result.runner_up_user[0].tolist() == [1]
+    assert result.runner_up_row[0].tolist() == [0]
+    assert result.wins[1].tolist() == [1]
+    assert result.runner_up_user[1].tolist() == [0]
+    assert result.tie_user.tolist() == [0]
+    assert result.tie_row.tolist() == [2]
+    assert result.exclusive[0].tolist() == []
+    assert result.exclusive[1].tolist() == [3]
+
+def test_compare_times_uses_best_time_per_map():
+    result = compare_times(arrays([1, 1], [1]), arrays([900, 100], [500]))
+    assert result.wins[0].tolist() == [1]
+    assert result.wins[1].tolist() == []
+
+def test_compare_styles_matches_compare_times_per_style():
+    rng = np.random.default_rng(0)
+    styles = [1, 2, 3]
+    map_ids, style_ids, times = [], [], []
+    for _ in range(3):
+        # every (map, style) at most once per user, plus some times in a style that isn't compared
+        keys = rng.choice(40 * 4, size=60, replace=False)
+        map_ids.append(keys // 4)
+        style_ids.append(keys % 4 + 1)
+        times.append(rng.integers(0, 20, size=60))
+    matrix = compare_styles(map_ids, style_ids, times, styles)
+    for k, style in enumerate(styles):
+        in_style = [s == style for s in style_ids]
+        result = compare_times([m[keep] for m, keep in zip(map_ids, in_style)], [t[keep] for t, keep in zip(times, in_style)])
+        assert matrix.ties[k] == len(result.tie_user)
+        for i in range(3):
+            assert matrix.wins[i, k] == len(result.wins[i])
+            assert matrix.exclusive[i, k] == len(result.exclusive[i])
@@ -0,0 +1,332 @@
+import asyncio
+import datetime
+from email.utils import format_datetime
+
+import pytest
+
+from modules import http
+from modules.http import CacheEntry, HedgePolicy, Priority, RateLimiter, ResponseCache, RetryPolicy, SingleFlight, parse_retry_after, request_priority, with_priority
+
+# stands in for the time module in modules.http so the bucket can be refilled without waiting
+# (only for tests that don't run an event loop, asyncio keeps using the real clock)
+class FakeTime:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    fake = FakeTime()
+    monkeypatch.setattr(http, "time", fake)
+    return fake
+
+def test_single_flight_coalesces():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+        async def func():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+        results = await asyncio.gather(*[flight.do("key", func) for _ in range(5)])
+        assert results == [1] * 5
+        assert calls == 1
+    asyncio.run(main())
+
+def test_single_flight_cancels_call_when_last_waiter_leaves():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+        async def func():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        task = asyncio.ensure_future(flight.do("key", func))
+        await started.wait()
+        task.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # a new caller starts a fresh call instead of getting the cancelled one
+        async def other():
+            return "fresh"
+        assert await flight.do("key", other) == "fresh"
+    asyncio.run(main())
+
+def test_single_flight_keeps_call_for_remaining_waiters():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        async def func():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+        first = asyncio.ensure_future(flight.do("key", func))
+        second = asyncio.ensure_future(flight.do("key", func))
+        await started.wait()
+        first.cancel()
+        assert await second == "done"
+    asyncio.run(main())
+
+def test_rate_limiter_refills(clock):
+    limiter = RateLimiter(capacity=10, period=10.0)
+    for _ in range(10):
+        assert limiter.try_acquire()
+    assert limiter.remaining == 0
+    assert not limiter.try_acquire()
+    assert limiter.wait_time() == pytest.approx(1.0)
+    clock.now += 2.5
+    assert limiter.remaining == 2
+    clock.now += 100
+    # never refills past capacity
+    assert limiter.remaining == 10
+
+def test_rate_limiter_drain(clock):
+    limiter = RateLimiter(capacity=10, period=10.0)
+    # a 429 empties the bucket even though we thought there were tokens left
+    limiter.drain()
+    assert limiter.remaining == 0
+    assert limiter.wait_time() == pytest.approx(1.0)
+    # with Retry-After nothing goes out until it has passed
+    limiter.drain(5.0)
+    assert limiter.wait_time() == pytest.approx(5.0)
+    clock.now += 4.9
+    assert limiter.wait_time() > 0
+    clock.now += 0.1
+    assert limiter.wait_time() == pytest.approx(0.0)
+
+def test_rate_limiter_update_only_lowers_tokens(clock):
+    limiter = RateLimiter(capacity=100, period=60.0)
+    limiter.update({"x-rate-limit-limit": "50", "x-rate-limit-burst": "30", "x-rate-limit-remaining": "20"})
+    assert limiter.capacity == 50
+    assert limiter.period == 30.0
+    assert limiter.remaining == 20
+    limiter.update({"x-rate-limit-remaining": "40"})
+    assert limiter.remaining == 20
+
+def test_rate_limiter_waits_for_refill():
+    async def main():
+        limiter = RateLimiter(capacity=2, period=0.1, max_wait=1.0)
+        assert await limiter.acquire()
+        assert await limiter.acquire()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert await asyncio.wait_for(limiter.acquire(), 1)
+        assert loop.time() - start >= 0.04
+    asyncio.run(main())
+
+def test_rate_limiter_refuses_past_max_wait():
+    async def main():
+        limiter = RateLimiter(capacity=1, period=10.0, max_wait=1.0)
+        assert await limiter.acquire()
+        # the next token is 10s away
+        assert not await asyncio.wait_for(limiter.acquire(), 1)
+    asyncio.run(main())
+
+def test_rate_limiter_expires_queued_waiter():
+    async def main():
+        limiter = RateLimiter(capacity=1, period=0.1, max_wait=0.15)
+        assert await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # a 429 pushes the next token past the waiter's deadline, it's refused instead of left hanging
+        limiter.drain(1.0)
+        assert not await asyncio.wait_for(waiter, 1)
+        assert not limiter._waiters
+    asyncio.run(main())
+
+def entry(n : int) -> CacheEntry:
+    return CacheEntry(f"etag{n}", None, {}, f"[{n}]")
+
+def test_response_cache_round_trip(tmp_path):
+    async def main():
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        assert await cache.get("a") is None
+        await cache.set("a", entry(1))
+        stored = await cache.get("a")
+        assert stored.etag == "etag1"
+        assert stored.body == "[1]"
+        await cache.close()
+    asyncio.run(main())
+
+def test_response_cache_skips_thread_for_unknown_keys(tmp_path):
+    async def main():
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        await cache.set("a", entry(1))
+        assert await cache.get("a") is not None
+        def fail(key):
+            raise AssertionError(f"looked up {key} in sqlite")
+        cache._get = fail
+        assert await cache.get("b") is None
+        await cache.close()
+    asyncio.run(main())
+
+def test_response_cache_prunes_while_running(tmp_path, clock):
+    async def main():
+        cache = ResponseCache(str(tmp_path / "cache.db"), max_age=100.0, max_rows=5, prune_every=3)
+        await cache.get("warm up")
+        for n in range(12):
+            clock.now += 1
+            await cache.set(str(n), entry(n))
+        # pruned after the 3rd, 6th, 9th and 12th set, only the newest 5 are left
+        assert cache._keys == {"7", "8", "9", "10", "11"}
+        assert cache._load_keys() == cache._keys
+        # everything expires eventually, even without a restart
+        clock.now += 1000
+        assert await cache.get("11") is None
+        for n in range(3):
+            await cache.set(f"new{n}", entry(n))
+        assert cache._load_keys() == {"new0", "new1", "new2"}
+        assert cache._keys == {"new0", "new1", "new2"}
+        await cache.close()
+    asyncio.run(main())
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+
+def test_parse_retry_after_http_date():
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(later, usegmt=True)) == pytest.approx(30, abs=2)
+    earlier = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(earlier, usegmt=True)) == 0.0
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(max_attempts=10, backoff_base=0.5, backoff_max=3.0, jitter=0.0)
+    assert [policy.next_delay("GET", attempt, 503) for attempt in range(1, 6)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+    jittered = RetryPolicy(backoff_base=1.0, jitter=0.5)
+    for _ in range(50):
+        assert 0.5 <= jittered.next_delay("GET", 1, None) <= 1.0
+
+def test_retry_policy_gives_up():
+    policy = RetryPolicy(max_attempts=3, jitter=0.0)
+    assert policy.next_delay("GET", 2, 500) is not None
+    assert policy.next_delay("GET", 3, 500) is None
+    # not retryable
+    assert policy.next_delay("GET", 1, 400) is None
+    assert policy.next_delay("GET", 1, 404) is None
+    assert policy.next_delay("POST", 1, 500) is None
+    # timeouts and connection errors have no status and are always retried
+    assert policy.next_delay("GET", 1, None) is not None
+
+def test_retry_policy_retry_after():
+    policy = RetryPolicy(max_retry_after=30.0)
+    assert policy.next_delay("GET", 1, 429, 12.0) == 12.0
+    assert policy.next_delay("GET", 1, 429, 60.0) is None
+
+def test_rate_limiter_serves_interactive_first():
+    async def main():
+        limiter = RateLimiter(capacity=10, period=0.5, max_wait=1.0, background_max_wait=1.0)
+        while limiter.try_acquire():
+            pass
+        order = []
+        async def acquire(name, priority):
+            assert await limiter.acquire(priority)
+            order.append(name)
+        background = [asyncio.ensure_future(acquire(f"background{n}", Priority.BACKGROUND)) for n in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(acquire("interactive", Priority.INTERACTIVE))
+        await asyncio.wait_for(asyncio.gather(interactive, *background), 2)
+        assert order == ["interactive", "background0", "background1"]
+    asyncio.run(main())
+
+def test_rate_limiter_background_reserve(clock):
+    async def main():
+        limiter = RateLimiter(capacity=10, period=10.0, background_max_wait=0.5, background_reserve=0.2)
+        # background requests leave 2 of the 10 tokens for interactive ones
+        for _ in range(8):
+            assert await limiter.acquire(Priority.BACKGROUND)
+        assert limiter.wait_time(Priority.BACKGROUND) == pytest.approx(1.0)
+        assert limiter.wait_time(Priority.INTERACTIVE) == 0
+        # the next background token is further away than background_max_wait
+        assert not await limiter.acquire(Priority.BACKGROUND)
+        assert await limiter.acquire(Priority.INTERACTIVE)
+        assert await limiter.acquire(Priority.INTERACTIVE)
+    asyncio.run(main())
+
+def test_with_priority():
+    seen = []
+    @with_priority
+    async def func():
+        seen.append(request_priority.get())
+        # tasks started by the call keep its priority
+        await asyncio.ensure_future(inner())
+    async def inner():
+        seen.append(request_priority.get())
+    async def main():
+        await func()
+        await func(priority=Priority.BACKGROUND)
+        seen.append(request_priority.get())
+    asyncio.run(main())
+    assert seen == [Priority.INTERACTIVE, Priority.INTERACTIVE, Priority.BACKGROUND, Priority.BACKGROUND, Priority.INTERACTIVE]
+
+def test_hedge_cancels_loser():
+    async def main():
+        policy = HedgePolicy(max_delay=0.01)
+        calls = 0
+        slow_cancelled = asyncio.Event()
+        async def send():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    slow_cancelled.set()
+                    raise
+            return calls
+        assert await asyncio.wait_for(policy.run(send), 1) == 2
+        await asyncio.wait_for(slow_cancelled.wait(), 1)
+        assert list(policy._hedged) == [True]
+    asyncio.run(main())
+
+def test_hedge_falls_back_to_first_error():
+    async def main():
+        policy = HedgePolicy(max_delay=0.01)
+        calls = 0
+        async def send():
+            nonlocal calls
+            calls += 1
+            call = calls
+            await asyncio.sleep(0.05 if call == 1 else 0)
+            raise ValueError(call)
+        with pytest.raises(ValueError) as info:
+            await asyncio.wait_for(policy.run(send), 1)
+        assert info.value.args == (1,)
+    asyncio.run(main())
+
+def test_hedge_respects_rate_limit_budget(clock):
+    policy = HedgePolicy(min_remaining=0.5)
+    limiter = RateLimiter(capacity=10, period=60.0)
+    # a hedge takes a token, but only while at least half the bucket would be left
+    for _ in range(5):
+        assert policy.can_hedge(limiter)
+    assert limiter.remaining == 5
+    assert not policy.can_hedge(limiter)
+    assert limiter.remaining == 5
+
+def test_hedge_respects_hedge_budget(clock):
+    policy = HedgePolicy(window=10, budget=0.2)
+    limiter = RateLimiter(capacity=10, period=60.0)
+    policy.record(0.1, True)
+    assert policy.can_hedge(limiter)
+    policy.record(0.1, True)
+    # 2 of the last 10 requests were hedged already, no tokens are taken for a hedge that isn't sent
+    assert not policy.can_hedge(limiter)
+    assert limiter.remaining == 9
+    for _ in range(9):
+        policy.record(0.1, False)
+    assert policy.can_hedge(limiter)
@@ -0,0 +1,383 @@
+import asyncio
+import datetime
+
+import pytest
+
+from modules.catalog import MapCatalog, save_catalog
+from modules.http import CachedResponse, RateLimiter, RetryPolicy
+from modules.strafes import APIError, JSONRes, PageInfoCache, RateLimitError, StrafesClient
+from modules.strafes_base import Date, Game, Map, User
+from modules.utils import open_json, write_json
+
+def make_client() -> StrafesClient:
+    return StrafesClient("", "", cache_path=None, catalog_path=None)
+
+def test_cancelled_caller_cancels_request():
+    async def main():
+        strafes = make_client()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+        async def get_once(*args, **kwargs):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        strafes._get_once = get_once
+        task = asyncio.ensure_future(strafes.get_strafes("map", {"game":1, "page":1}))
+        await asyncio.wait_for(started.wait(), 1)
+        task.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await strafes.close()
+    asyncio.run(main())
+
+def test_page_info_cache_prunes_expired_entries_on_set():
+    cache = PageInfoCache(ttl=-1.0)
+    for user in range(100):
+        cache.set(f"time/user/{user}", {"page": 1}, 3, 10)
+    assert len(cache) == 0
+
+def test_page_info_cache_is_bounded():
+    cache = PageInfoCache(max_entries=10)
+    for user in range(100):
+        cache.set(f"time/user/{user}", {"page": 1}, 3, 10)
+    assert len(cache) == 10
+    assert cache.get("time/user/0", {}) is None
+    assert cache.get("time/user/99", {"page": 2}) == (3, 10)
+
+def test_load_saved_maps(tmp_path):
+    path = str(tmp_path / "catalog.json.gz")
+    save_catalog(path, MapCatalog([Map(1, "bhop_test", "someone", Game.BHOP, Date(0), 5, None)], []))
+    async def main():
+        strafes = StrafesClient("", "", cache_path=None, catalog_path=path)
+        assert await strafes.load_saved_maps()
+        assert (await strafes.map_from_id(1)).displayname == "bhop_test"
+        missing = StrafesClient("", "", cache_path=None, catalog_path=str(tmp_path / "missing.json.gz"))
+        assert not await missing.load_saved_maps()
+        await strafes.close()
+        await missing.close()
+    asyncio.run(main())
+
+def test_records_from_dicts_looks_up_users_by_id():
+    # v1 times only have the user's id
+    records = [{
+        "id": n,
+        "time": 1000 + n,
+        "User": 100 + n % 2,
+        "map": {"id": 5, "display_name": "bhop_test", "game_id": 1},
+        "date": "2023-01-01T12:00:00Z",
+        "style_id": 1,
+        "mode_id": 0,
+        "game_id": 1,
+        "has_bot": False
+    } for n in range(4)]
+    users = {100: User(100, "first"), 101: User(101, "second")}
+    result = make_client().records_from_dicts(records, users=users)
+    assert [record.user.username for record in result] == ["first", "second", "first", "second"]
+    assert result[0].user is result[2].user
+
+def test_request_raises_when_rate_limited():
+    async def main():
+        strafes = make_client()
+        limiter = strafes._ratelimiters["strafes.net"] = RateLimiter(capacity=1, period=60.0, max_wait=1.0)
+        limiter.drain()
+        sent = False
+        async def send():
+            nonlocal sent
+            sent = True
+        with pytest.raises(RateLimitError):
+            await asyncio.wait_for(strafes._request("GET", "https://api.strafes.net/api/v1/map", "strafes.net", {}, {}, send), 1)
+        assert not sent
+    asyncio.run(main())
+
+def failing_send(statuses):
+    attempts = []
+    async def send():
+        attempts.append(len(attempts) + 1)
+        status = statuses[len(attempts) - 1]
+        if status is not None:
+            raise APIError("url", {}, {}, status, "", "test")
+        return "ok"
+    return send, attempts
+
+def test_request_retries_until_success():
+    async def main():
+        strafes = make_client()
+        strafes._retry_policies["test"] = RetryPolicy(max_attempts=3, backoff_base=0.001)
+        send, attempts = failing_send([503, 502, None])
+        assert await strafes._request("GET", "url", "test", {}, {}, send) == "ok"
+        assert attempts == [1, 2, 3]
+    asyncio.run(main())
+
+def test_request_gives_up_after_max_attempts():
+    async def main():
+        strafes = make_client()
+        strafes._retry_policies["test"] = RetryPolicy(max_attempts=3, backoff_base=0.001)
+        send, attempts = failing_send([503, 503, 503, None])
+        with pytest.raises(APIError) as info:
+            await strafes._request("GET", "url", "test", {}, {}, send)
+        assert info.value.status == 503
+        assert attempts == [1, 2, 3]
+    asyncio.run(main())
+
+def test_request_doesnt_retry_client_errors():
+    async def main():
+        strafes = make_client()
+        strafes._retry_policies["test"] = RetryPolicy(max_attempts=3, backoff_base=0.001)
+        send, attempts = failing_send([400, None])
+        with pytest.raises(APIError):
+            await strafes._request("GET", "url", "test", {}, {}, send)
+        assert attempts == [1]
+    asyncio.run(main())
+
+def test_hedged_apis_have_a_rate_limiter():
+    strafes = make_client()
+    for api_name, policy in strafes._hedge_policies.items():
+        if policy is not None:
+            assert strafes._ratelimiters.get(api_name) is not None, api_name
+
+def map_dict(map_id : int, name : str = "") -> dict:
+    return {"id": map_id, "display_name": name or f"bhop_map{map_id}", "creator": "someone", "Game": Game.BHOP.value, 
+        "date": "2023-01-01T12:00:00Z"}
+
+# the paginated map endpoint, maps are listed oldest first like the real one
+class FakeMapApi:
+
+    def __init__(self, bhop_maps, page_size : int = 3):
+        self.maps = {Game.BHOP.value: bhop_maps, Game.SURF.value: []}
+        self.page_size = page_size
+        # the bhop pages requested
+        self.pages = []
+
+    async def get_strafes(self, end_of_url, params={}):
+        assert end_of_url == "map"
+        maps = self.maps[params["game"]]
+        page = params["page"]
+        if params["game"] == Game.BHOP.value:
+            self.pages.append(page)
+        page_count = (len(maps) - 1) // self.page_size + 1 if maps else 0
+        data = maps[(page - 1) * self.page_size:page * self.page_size]
+        return JSONRes(CachedResponse("", 200, {"Pagination-Count": str(page_count)}), data)
+
+# a client with the catalog loaded from 8 maps (pages [1, 2, 3], [4, 5, 6], [7, 8])
+def client_with_maps():
+    api = FakeMapApi([map_dict(map_id) for map_id in range(1, 9)])
+    strafes = make_client()
+    strafes.get_strafes = api.get_strafes
+    asyncio.run(strafes.refresh_maps())
+    assert sorted(api.pages) == [1, 2, 3]
+    api.pages = []
+    return strafes, api
+
+def catalog_names(strafes):
+    return {map_id: map.displayname for map_id, map in strafes._catalog.lookup.items()}
+
+def test_refresh_maps_without_changes():
+    strafes, api = client_with_maps()
+    catalog = strafes._catalog
+    asyncio.run(strafes.refresh_maps())
+    assert api.pages == [1, 3]
+    assert strafes._catalog is catalog
+
+def test_refresh_maps_added():
+    strafes, api = client_with_maps()
+    api.maps[Game.BHOP.value].append(map_dict(9))
+    asyncio.run(strafes.refresh_maps())
+    # page 3 had something new, page 2 didn't so the walk stops there
+    assert api.pages == [1, 3, 2]
+    assert catalog_names(strafes)[9] == "bhop_map9"
+    assert len(strafes._catalog.lookup) == 9
+
+def test_refresh_maps_added_new_page():
+    strafes, api = client_with_maps()
+    api.maps[Game.BHOP.value] += [map_dict(9), map_dict(10)]
+    asyncio.run(strafes.refresh_maps())
+    assert api.pages == [1, 4, 3, 2]
+    assert len(strafes._catalog.lookup) == 10
+
+def test_refresh_maps_renamed():
+    strafes, api = client_with_maps()
+    api.maps[Game.BHOP.value][0] = map_dict(1, "bhop_first")
+    api.maps[Game.BHOP.value][7] = map_dict(8, "bhop_last")
+    asyncio.run(strafes.refresh_maps())
+    assert api.pages == [1, 3, 2]
+    names = catalog_names(strafes)
+    assert names[1] == "bhop_first"
+    assert names[8] == "bhop_last"
+
+def test_refresh_maps_misses_middle_page_changes():
+    # only the first page and the pages from the end back to the first one without changes are fetched,
+    # so a map renamed on a page in between is only picked up by the next full load
+    strafes, api = client_with_maps()
+    api.maps[Game.BHOP.value][4] = map_dict(5, "bhop_renamed")
+    asyncio.run(strafes.refresh_maps())
+    assert api.pages == [1, 3]
+    assert catalog_names(strafes)[5] == "bhop_map5"
+
+def test_refresh_maps_removed():
+    strafes, api = client_with_maps()
+    del api.maps[Game.BHOP.value][4]
+    asyncio.run(strafes.refresh_maps())
+    # the count doesn't add up, so everything is loaded again
+    assert api.pages[:2] == [1, 3]
+    assert sorted(api.pages[2:]) == [1, 2, 3]
+    assert 5 not in strafes._catalog.lookup
+    assert len(strafes._catalog.lookup) == 7
+
+def test_refresh_maps_removed_and_added():
+    strafes, api = client_with_maps()
+    del api.maps[Game.BHOP.value][4]
+    api.maps[Game.BHOP.value].append(map_dict(9))
+    asyncio.run(strafes.refresh_maps())
+    # same count as before, but the new map shows the removal
+    assert 5 not in strafes._catalog.lookup
+    assert 9 in strafes._catalog.lookup
+
+def global_dict(record_id : int, map_id : int = 5, thumbnail : str = "https://x/map.png") -> dict:
+    return {
+        "id": record_id,
+        "time": 1000,
+        "user": {"id": 100, "username": "first", "thumbnail": "https://x/user.png"},
+        "map": {"id": map_id, "display_name": "bhop_test", "game_id": 1, "thumbnail": thumbnail},
+        "date": "2023-01-01T12:00:00Z",
+        "style_id": 1,
+        "course": 0,
+        "game_id": 1,
+        "has_bot": True
+    }
+
+def test_records_from_dicts_strafes_globals():
+    record, = make_client().records_from_dicts([global_dict(1)], strafes_globals=True)
+    assert record.id == 1
+    assert record.mode == 0
+    assert record.has_bot
+    assert record.user.username == "first"
+    assert record.user.thumbnail == "https://x/user.png"
+    assert record.map.displayname == "bhop_test"
+    assert record.map.thumbnail == "https://x/map.png"
+
+def test_records_from_dicts_keeps_global_thumbnail_with_catalog():
+    strafes = make_client()
+    strafes._catalog = MapCatalog([Map(5, "bhop_test", "someone", Game.BHOP, Date(0), 7, None)], [])
+    catalog_map = strafes._catalog.lookup[5]
+    first, second = strafes.records_from_dicts([global_dict(1), global_dict(2)], strafes_globals=True)
+    assert first.map.thumbnail == "https://x/map.png"
+    # everything else still comes from the catalog, which isn't modified
+    assert first.map.creator == "someone"
+    assert first.map.playcount == 7
+    assert first.map is second.map
+    assert catalog_map.thumbnail is None
+    # without a thumbnail in the payload the catalog's map is used as is
+    record, = strafes.records_from_dicts([global_dict(3, thumbnail=None)], strafes_globals=True)
+    assert record.map is catalog_map
+
+def utc_iso(hours_ago : float = 0) -> str:
+    date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours_ago)
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# a wr as listed by the fiveman1 strafes api
+def wr_dict(record_id : int, user_id : int, time : int, map_id : int = 5, hours_ago : float = 0) -> dict:
+    return {
+        "id": record_id,
+        "time": time,
+        "user": {"id": user_id, "username": f"user{user_id}", "thumbnail": None},
+        "map": {"id": map_id, "display_name": f"bhop_map{map_id}", "game_id": 1},
+        "date": utc_iso(hours_ago),
+        "style_id": 1,
+        "course": 0,
+        "game_id": 1,
+        "has_bot": False
+    }
+
+# a time as listed by the v1 strafes api, for the leaderboards checked by calculate_wr_diff
+def time_dict(record_id : int, user_id : int, time : int, map_id : int = 5) -> dict:
+    return {
+        "id": record_id,
+        "time": time,
+        "user": {"id": user_id, "username": f"user{user_id}"},
+        "map": {"id": map_id, "display_name": f"bhop_map{map_id}", "game_id": 1},
+        "date": utc_iso(1),
+        "style_id": 1,
+        "mode_id": 0,
+        "game_id": 1,
+        "has_bot": False
+    }
+
+# a client that gets the wrs in wrs and the leaderboards (by map id) in leaderboards
+# returns the client and the map ids whose leaderboard was checked
+def wr_client(tmp_path, wrs : list, leaderboards : dict = {}):
+    strafes = make_client()
+    strafes.RECENT_WRS_PATH = str(tmp_path / "recent_wrs.json")
+    checked = []
+    async def get_wrs():
+        return wrs
+    async def get_strafes(end_of_url, params={}):
+        assert end_of_url == "time"
+        checked.append(params["map_id"])
+        return JSONRes(None, {"data": leaderboards[params["map_id"]]})
+    strafes.get_wrs = get_wrs
+    strafes.get_strafes = get_strafes
+    return strafes, checked
+
+def announced(records) -> list:
+    return [(record.id, record.previous_record.id if record.previous_record else None) for record in records]
+
+def test_new_wrs_first_run(tmp_path):
+    wrs = [wr_dict(1, 100, 1000)]
+    strafes, checked = wr_client(tmp_path, wrs)
+    assert asyncio.run(strafes.get_new_wrs()) == []
+    assert open_json(strafes.RECENT_WRS_PATH) == wrs
+    assert checked == []
+
+def test_new_wrs_unchanged(tmp_path):
+    wrs = [wr_dict(1, 100, 1000)]
+    strafes, checked = wr_client(tmp_path, wrs)
+    write_json(strafes.RECENT_WRS_PATH, wrs)
+    assert asyncio.run(strafes.get_new_wrs()) == []
+    assert checked == []
+
+def test_new_wrs_same_player_improves(tmp_path):
+    # improving your own wr keeps the record's id
+    strafes, checked = wr_client(tmp_path, [wr_dict(1, 100, 900)])
+    write_json(strafes.RECENT_WRS_PATH, [wr_dict(1, 100, 1000, hours_ago=1)])
+    records = asyncio.run(strafes.get_new_wrs())
+    assert announced(records) == [(1, 1)]
+    assert records[0].diff == -0.1
+    assert records[0].previous_record.time.millis == 1000
+    assert checked == []
+    assert open_json(strafes.RECENT_WRS_PATH)[0]["time"] == 900
+
+def test_new_wrs_new_player_takes_wr(tmp_path):
+    strafes, checked = wr_client(tmp_path, [wr_dict(2, 200, 900)])
+    write_json(strafes.RECENT_WRS_PATH, [wr_dict(1, 100, 1000, hours_ago=1)])
+    records = asyncio.run(strafes.get_new_wrs())
+    # the previous wr comes from the old list, so the leaderboard isn't checked
+    assert announced(records) == [(2, 1)]
+    assert records[0].previous_record.user.username == "user100"
+    assert records[0].diff == -0.1
+    assert checked == []
+
+def test_new_wrs_removed_wr(tmp_path):
+    # the old wr was removed, so the next best time becomes the wr without being faster
+    leaderboards = {5: [time_dict(2, 200, 1100), time_dict(3, 300, 1200)]}
+    strafes, checked = wr_client(tmp_path, [wr_dict(2, 200, 1100)], leaderboards)
+    write_json(strafes.RECENT_WRS_PATH, [wr_dict(1, 100, 1000, hours_ago=1)])
+    records = asyncio.run(strafes.get_new_wrs())
+    assert checked == [5]
+    assert announced(records) == [(2, 3)]
+    assert records[0].diff == -0.1
+
+def test_new_wrs_checks_leaderboard_for_new_courses(tmp_path):
+    leaderboards = {
+        6: [time_dict(3, 300, 500, 6), time_dict(4, 400, 700, 6)],
+        # the top of the leaderboard isn't the listed wr, so it isn't announced
+        7: [time_dict(9, 900, 100, 7), time_dict(5, 500, 600, 7)]
+    }
+    wrs = [wr_dict(3, 300, 500, 6), wr_dict(5, 500, 600, 7), wr_dict(1, 100, 1000), wr_dict(8, 800, 100, 8, hours_ago=3)]
+    strafes, checked = wr_client(tmp_path, wrs, leaderboards)
+    write_json(strafes.RECENT_WRS_PATH, [wr_dict(1, 100, 1000, hours_ago=1)])
+    records = asyncio.run(strafes.get_new_wrs())
+    # wrs older than two hours aren't looked at
+    assert sorted(checked) == [6, 7]
+    assert announced(records) == [(3, 4)]